@@ -0,0 +1,90 @@
+import argparse
+import sys
+import numpy as np
+from config import load_config, build_state
+from fractal import occupancy_grid, box_count_dimension
+
+
+# Grow a colony to max_iters/max_agents and fit its box-counting dimension
+def colony_dimension(config):
+    state = build_state(config)
+    state.paused = False
+    while state.iteration < state.max_iters and state.agent_count() < config["max_agents"]:
+        state.update()
+    x, y, _, _ = state.agent_arrays()
+    fit = box_count_dimension(occupancy_grid(x, y, state.grid_size))
+    fit["agents"] = state.agent_count()
+    return fit
+
+
+# Box-counting dimension of the same seeds grown with float64 and with
+# float32 nutrient grids, one row per seed
+def compare_precision(seeds, overrides=None):
+    rows = []
+    for seed in seeds:
+        fits = {precision: colony_dimension(load_config(overrides=dict(overrides or {}, seed=seed,
+                                                                        precision=precision)))
+                for precision in ("float64", "float32")}
+        reference, compact = fits["float64"], fits["float32"]
+        rows.append({
+            "seed": seed,
+            "float64": reference["dimension"],
+            "float32": compact["dimension"],
+            "difference": compact["dimension"] - reference["dimension"],
+            "agents_float64": reference["agents"],
+            "agents_float32": compact["agents"],
+        })
+    return rows
+
+
+# Paired float32 - float64 differences against the spread of the float64
+# dimensions between seeds. float32 passes when no difference is larger than
+# `tolerance`, by default that seed-to-seed standard deviation: precision must
+# move the dimension less than changing the seed does.
+def summarise(rows, tolerance=None):
+    differences = np.array([row["difference"] for row in rows])
+    seed_std = np.std([row["float64"] for row in rows], ddof=1) if len(rows) > 1 else float("nan")
+    if tolerance is None:
+        if len(rows) < 2:
+            raise ValueError("Comparing against the seed-to-seed spread needs at least two seeds (or a tolerance)")
+        tolerance = seed_std
+    return {
+        "mean_difference": differences.mean(),
+        "mean_abs_difference": np.abs(differences).mean(),
+        "max_abs_difference": np.abs(differences).max(),
+        "seed_std": seed_std,
+        "tolerance": tolerance,
+        "passed": bool(np.abs(differences).max() <= tolerance),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check that float32 nutrient grids leave the fractal dimension '
+                                     'unchanged against float64 runs.')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--grid-size', type=int, default=256)
+    parser.add_argument('--max-agents', type=int, default=5000)
+    parser.add_argument('--max-iters', type=int, default=100000)
+    parser.add_argument('--engine', choices=['object', 'vector', 'jit'], default='vector')
+    parser.add_argument('--tolerance', type=float,
+                        help='Largest allowed |float32 - float64| dimension (default: seed-to-seed std)')
+    args = parser.parse_args(argv)
+    if args.tolerance is None and len(args.seeds) < 2:
+        parser.error("give at least two seeds, or a --tolerance")
+
+    rows = compare_precision(args.seeds, {"grid_size": args.grid_size, "max_agents": args.max_agents,
+                                          "max_iters": args.max_iters, "engine": args.engine})
+    for row in rows:
+        print(f"seed {row['seed']}: float64 {row['float64']:.4f}, float32 {row['float32']:.4f} "
+              f"({row['difference']:+.4f}), {row['agents_float64']}/{row['agents_float32']} agents")
+    summary = summarise(rows, args.tolerance)
+    print(f"paired difference mean {summary['mean_difference']:+.4f}, mean |difference| "
+          f"{summary['mean_abs_difference']:.4f}, max |difference| {summary['max_abs_difference']:.4f}")
+    print(f"seed-to-seed std of float64 dimensions {summary['seed_std']:.4f}, tolerance {summary['tolerance']:.4f}: "
+          f"{'ok' if summary['passed'] else 'FAILED'}")
+    if not summary["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,20 @@
 import math
-import numpy.random as npr
 import numpy as np
 
 PI = math.pi
 
-class Agent:
-    def __init__(self, x, y, mass, petri, params):
-        self.x = x
-        self.y = y
-        self.mass = mass
-        self.petri = petri
 
-        self.params = params
+# Agent parameters and the constants derived from them, one object shared by
+# every agent of a simulation rather than copied into each agent
+class AgentParams:
+    __slots__ = ("values", "r_max", "K_m", "m_min", "m_max", "delta_H", "F_d", "mu", "p", "density", "drag")
+
+    def __init__(self, params):
+        self.update(params)
+
+    # Read new parameter values (every agent sharing this object sees them)
+    def update(self, params):
+        self.values = params
         self.r_max = params["r_max"]
         self.K_m = params["K_m"]
         self.m_min = params["m_min"]
@@ -21,28 +24,54 @@ class Agent:
         self.mu = params["mu"]
         self.p = params["p"]
         self.density = params["density"]
+        self.drag = 4 * PI * self.mu
+
+
+# One bacterium. Only its own state is stored (slots, no per-agent dict);
+# parameters live in a shared AgentParams and size, radius and velocity are
+# worked out from the mass when needed.
+class Agent:
+    __slots__ = ("x", "y", "mass", "petri", "params", "imotile", "theta", "time_to_change")
+
+    # `params` is an AgentParams, or a dict of agent parameters to make one
+    def __init__(self, x, y, mass, petri, params):
+        self.x = x
+        self.y = y
+        self.mass = mass
+        self.petri = petri
         self.imotile = False
+        self.params = params if isinstance(params, AgentParams) else AgentParams(params)
+        self.update_properties()
+
+        self.theta = petri.rng.theta()
+        self.time_to_change = petri.rng.run_length()
 
-        self.size = mass / self.density
-        self.radius = math.sqrt(self.size / PI)
+    @property
+    def size(self):
+        return self.mass / self.params.density
 
-        self.drag = 4 * PI * self.mu  
-        self.velocity = (self.F_d / (self.drag * self.radius))
+    @property
+    def radius(self):
+        return math.sqrt(self.size / PI)
 
-        self.theta = npr.uniform(0, 2 * PI)
-        self.time_to_change = npr.poisson(10)
+    @property
+    def velocity(self):
+        params = self.params
+        return params.F_d / (params.drag * self.radius)
 
 
     # Consume nutrients if available
     def eat(self):
-        nutrient_level = self.petri.get_nutrient_level(round(self.x), round(self.y))
-        nutrients_taken = (self.r_max * nutrient_level) / (self.K_m + nutrient_level)
+        params = self.params
+        # Agent state stays float64 whatever the precision of the grid
+        nutrient_level = float(self.petri.get_nutrient_level(round(self.x), round(self.y)))
+        nutrients_taken = (params.r_max * nutrient_level) / (params.K_m + nutrient_level)
         
-        self.mass += (self.p * nutrients_taken * self.size)
+        self.mass += (params.p * nutrients_taken * self.size)
         self.petri.consume_nutrient(round(self.x), round(self.y), nutrients_taken)
         
         self.update_properties()
-        if self.m_min > self.mass:
+        if params.m_min > self.mass:
             self.imotile = True
         else:
             self.imotile = False
@@ -50,32 +79,31 @@ class Agent:
 
     # Move if big enough
     def move(self):
-        if self.m_min <= self.mass and self.mass < self.m_max: 
+        params = self.params
+        if params.m_min <= self.mass and self.mass < params.m_max: 
             if  self.time_to_change > 0:
-                dx = self.velocity * math.cos(self.theta)
-                dy = self.velocity * math.sin(self.theta)
+                velocity = self.velocity
+                dx = velocity * math.cos(self.theta)
+                dy = velocity * math.sin(self.theta)
                 
                 self.x = max(0, min(self.x + dx, self.petri.grid_size - 1))
                 self.y = max(0, min(self.y + dy, self.petri.grid_size - 1))
+                if self.petri.index is not None:
+                    self.petri.index.move(self, self.x, self.y)
                 
-                work_done = abs(self.F_d) * self.velocity
-                self.mass -= (work_done / self.delta_H)
+                work_done = abs(params.F_d) * velocity
+                self.mass -= (work_done / params.delta_H)
                 self.update_properties()
                 self.time_to_change -= 1
             else:
-                # npr.seed(self.seed)
-                self.theta = npr.uniform(0, 2 * PI)
-                self.time_to_change = npr.poisson(10)
+                self.theta = self.petri.rng.theta()
+                self.time_to_change = self.petri.rng.run_length()
 
     # Replicate if over mass_max
     def replicate(self):
-        if self.mass >= self.m_max:
+        if self.mass >= self.params.m_max:
             # Pick a random direction from 8 possible directions (Moore neighborhood)
-            dx, dy = npr.choice([-1, 0, 1]), npr.choice([-1, 0, 1])
-
-            # Ensure at least one direction is nonzero (prevents no movement)
-            while dx == 0 and dy == 0:
-                dx, dy = npr.choice([-1, 0, 1]), npr.choice([-1, 0, 1])
+            dx, dy = self.petri.rng.direction()
 
             new_x = max(0, min(self.petri.grid_size - 1, self.x + dx))
             new_y = max(0, min(self.petri.grid_size - 1, self.y + dy))            
@@ -86,11 +114,7 @@ class Agent:
         return None
 
 
-    # Recalculate properties
+    # Check the properties after the mass changed (they are derived from it)
     def update_properties(self):
-        self.size = self.mass / self.density
         if self.size < 0:
-            print(f"[WARNING] Agent size negative: {self.size}, mass: {self.mass}, density: {self.density}")
-        
-        self.radius = math.sqrt(self.size / PI)
-        self.velocity = (self.F_d / (self.drag * self.radius))
+            print(f"[WARNING] Agent size negative: {self.size}, mass: {self.mass}, density: {self.params.density}")
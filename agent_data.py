@@ -0,0 +1,82 @@
+import json
+import zipfile
+import numpy as np
+
+# Columns of an agent data file, one array each
+AGENT_COLUMNS = ("x", "y", "mass", "imotile")
+
+
+# Write the agents of a simulation as columns of an uncompressed .npz file
+# (float64 x, y, mass and bool imotile) with the simulation and agent
+# parameters stored as a JSON string under "params". Uncompressed members
+# can be memory-mapped by load_agents.
+def save_agents(state, filename):
+    x, y, mass, imotile = state.agent_arrays()
+    params = {
+        "simulation_params": {
+            "grid_size": state.grid_size,
+            "c_max": state.c_max,
+            "d_c": state.d_c,
+            "time_step": state.time_step,
+            "num_agents_initial": state.num_agents,
+            "current_iteration": state.iteration,
+            "seed": state.seed,
+        },
+        "agent_params": state.agent_params,
+    }
+    with open(filename, 'wb') as f:
+        np.savez(f, params=np.array(json.dumps(params)),
+                 x=np.asarray(x, dtype=float), y=np.asarray(y, dtype=float),
+                 mass=np.asarray(mass, dtype=float), imotile=np.asarray(imotile, dtype=bool))
+
+
+# Read an agent data file as (params, columns). .npz files written by
+# save_agents give their arrays directly, read-only memory maps with
+# mmap=True; legacy save_data JSON files are converted to the same columns.
+def load_agents(filename, mmap=False):
+    if filename.endswith(".json"):
+        return _load_json(filename)
+    if mmap:
+        columns = _memmap_npz(filename)
+        params = json.loads(str(columns.pop("params")))
+        return params, columns
+    with np.load(filename) as data:
+        params = json.loads(str(data["params"]))
+        return params, {name: data[name] for name in AGENT_COLUMNS}
+
+
+def _load_json(filename):
+    with open(filename, 'r') as f:
+        data = json.load(f)
+    agents = data.pop("agents")
+    columns = {name: np.array([a[name] for a in agents], dtype=float) for name in ("x", "y", "mass")}
+    columns["imotile"] = np.array([a.get("imotile", False) for a in agents], dtype=bool)
+    return data, columns
+
+
+# Memory-map every array of an uncompressed .npz file. Each member is a .npy
+# file stored as is inside the zip, so its data sits at a fixed file offset.
+def _memmap_npz(filename):
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"Cannot memory-map compressed member {info.filename} of {filename}")
+            # Local file header: 30 bytes, then the name and extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len(".npy")]
+            if dtype.hasobject or dtype.kind == "U":
+                # Small non-numeric members (the params string) are read normally
+                with archive.open(info) as member:
+                    arrays[name] = np.load(member)
+            else:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
@@ -0,0 +1,213 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import numpy as np
+from agent import Agent
+from config import load_config, build_state
+from fractal import BOX_SIZES, occupancy_grid, box_count, box_count_dimension, lacunarity
+from petri import DIFFUSION_BACKENDS
+from render import render_frame
+
+COLONY_SIZES = [50, 1000, 10000, 30000]
+GRID_SIZES = [256, 512, 1024]
+ENGINES = ["vector", "jit", "object"]
+BENCH_SEED = 1234
+
+
+# A simulation with `agents` agents scattered over a disc around the centre
+# (about one agent per cell), always built the same way from BENCH_SEED
+def colony_state(agents, grid_size, engine="vector", diffusion="stencil", active_region=True):
+    config = load_config(overrides={"seed": BENCH_SEED, "grid_size": grid_size, "num_agents": 0,
+                                    "engine": engine, "diffusion": diffusion, "active_region": active_region})
+    state = build_state(config)
+    state.paused = False
+    rng = np.random.default_rng(BENCH_SEED)
+    radius = min(np.sqrt(agents / np.pi), grid_size / 2 - 2)
+    r = radius * np.sqrt(rng.uniform(size=agents))
+    angle = rng.uniform(0, 2 * np.pi, agents)
+    center = grid_size // 2
+    x = (center + r * np.cos(angle)).astype(int)
+    y = (center + r * np.sin(angle)).astype(int)
+    m_min = float(state.agent_params["m_min"])
+    mass = rng.uniform(m_min, 2 * m_min, agents)
+    if state.population is not None:
+        state.population.add_agents(x, y, mass)
+    else:
+        for i in range(agents):
+            state.petri.add_agent(Agent(int(x[i]), int(y[i]), float(mass[i]), state.petri, state.shared_agent_params))
+    return state
+
+
+# Seconds per call of fn: repeated until it has run `min_calls` times and for
+# at least `min_time` seconds, after one untimed warm-up call (JIT compiling,
+# scratch buffers)
+def time_per_call(fn, min_time=0.5, min_calls=3):
+    fn()
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if calls >= min_calls and elapsed >= min_time:
+            return elapsed / calls
+
+
+# Simulation steps per second for every engine, grid size and colony size
+def bench_steps(engines, grid_sizes, colony_sizes, min_time):
+    results = {}
+    for engine in engines:
+        for grid_size in grid_sizes:
+            for agents in colony_sizes:
+                state = colony_state(agents, grid_size, engine)
+                results[f"step/{engine}/grid{grid_size}/agents{agents}"] = \
+                    (1 / time_per_call(state.update, min_time), "steps/s")
+    return results
+
+
+# Cost of each agent phase on its own at the largest grid size
+def bench_phases(engines, grid_size, colony_sizes, min_time):
+    results = {}
+    for engine in engines:
+        for agents in colony_sizes:
+            state = colony_state(agents, grid_size, engine)
+            if engine == "jit":
+                # eat and move are fused, so only the whole agent step is timed
+                phases = {"agents": state.population.step}
+            elif state.population is not None:
+                phases = {"eat": state.population.eat, "move": state.population.move,
+                          "replicate": state.population.replicate}
+            else:
+                phases = {name: (lambda name=name: [getattr(agent, name)() for agent in list(state.petri.agents)])
+                          for name in ("eat", "move", "replicate")}
+            for name, fn in phases.items():
+                results[f"phase/{engine}/{name}/agents{agents}"] = (1000 * time_per_call(fn, min_time), "ms")
+    return results
+
+
+# One diffusion step of every backend over the whole grid, plus the stencil
+# limited to the region a 1000-agent colony has disturbed
+def bench_diffusion(grid_sizes, min_time):
+    results = {}
+    for grid_size in grid_sizes:
+        for backend in DIFFUSION_BACKENDS:
+            petri = colony_state(1000, grid_size, diffusion=backend, active_region=False).petri
+            petri.nutrient_grid[grid_size // 2, grid_size // 2] = 0
+            results[f"diffuse/{backend}/grid{grid_size}"] = (1000 * time_per_call(petri.diffuse, min_time), "ms")
+        state = colony_state(1000, grid_size)
+        for _ in range(10):
+            state.update()
+        results[f"diffuse/stencil-active/grid{grid_size}"] = \
+            (1000 * time_per_call(state.petri.diffuse, min_time), "ms")
+    return results
+
+
+# Rendering one frame of a 10000-agent colony: the RGB image, and with pygame
+# also the surface and 2x scale of main.draw_grid
+def bench_render(grid_sizes, min_time):
+    try:
+        import pygame
+    except ImportError:
+        pygame = None
+    results = {}
+    for grid_size in grid_sizes:
+        state = colony_state(min(10000, grid_size ** 2 // 8), grid_size)
+        x, y, _, imotile = state.agent_arrays()
+        frame = lambda: render_frame(state.petri.nutrient_grid, state.petri.C_max, x, y, imotile)
+        results[f"render/frame/grid{grid_size}"] = (1000 * time_per_call(frame, min_time), "ms")
+        if pygame is not None:
+            draw = lambda: pygame.transform.scale(pygame.surfarray.make_surface(frame()),
+                                                  (grid_size * 2, grid_size * 2))
+            results[f"render/draw_grid/grid{grid_size}"] = (1000 * time_per_call(draw, min_time), "ms")
+    return results
+
+
+# Fractal analysis of one snapshot of a 10000-agent colony
+def bench_analysis(grid_sizes, min_time):
+    results = {}
+    for grid_size in grid_sizes:
+        x, y, _, _ = colony_state(min(10000, grid_size ** 2 // 8), grid_size).agent_arrays()
+        grid = occupancy_grid(x, y, grid_size)
+        for name, fn in (("box_count", lambda: box_count(grid, BOX_SIZES)),
+                         ("lacunarity", lambda: lacunarity(grid, BOX_SIZES)),
+                         ("box_count_dimension", lambda: box_count_dimension(grid))):
+            results[f"analysis/{name}/grid{grid_size}"] = (1000 * time_per_call(fn, min_time), "ms")
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Last history entry, or None
+def last_entry(history_path):
+    if not os.path.exists(history_path):
+        return None
+    with open(history_path, 'r') as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+# Print every result, with the change against `previous` where it has the same
+# benchmark (positive means faster)
+def report(results, previous=None):
+    old = previous["results"] if previous else {}
+    for name, (value, unit) in results.items():
+        line = f"{name:<45} {value:12.3f} {unit}"
+        if name in old:
+            before = old[name][0]
+            change = (value / before - 1) if unit == "steps/s" else (before / value - 1)
+            line += f"   {100 * change:+6.1f}% vs {previous['commit'] or previous['time']}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulation, diffusion, rendering and analysis.')
+    parser.add_argument('--suites', nargs='+', default=['steps', 'phases', 'diffusion', 'render', 'analysis'],
+                        choices=['steps', 'phases', 'diffusion', 'render', 'analysis'])
+    parser.add_argument('--engines', nargs='+', default=['vector'], choices=ENGINES,
+                        help="Engines to step (the object engine is slow at large colony sizes)")
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=GRID_SIZES)
+    parser.add_argument('--agents', type=int, nargs='+', default=COLONY_SIZES, help='Colony sizes')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds to spend on each benchmark')
+    parser.add_argument('--history', default='benchmark_history.jsonl',
+                        help='Results are appended to this file and compared with its last entry')
+    parser.add_argument('--no-save', action='store_true', help="Don't append the results to the history")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if 'steps' in args.suites:
+        results.update(bench_steps(args.engines, args.grid_sizes, args.agents, args.min_time))
+    if 'phases' in args.suites:
+        results.update(bench_phases(args.engines, max(args.grid_sizes), args.agents, args.min_time))
+    if 'diffusion' in args.suites:
+        results.update(bench_diffusion(args.grid_sizes, args.min_time))
+    if 'render' in args.suites:
+        results.update(bench_render(args.grid_sizes, args.min_time))
+    if 'analysis' in args.suites:
+        results.update(bench_analysis(args.grid_sizes, args.min_time))
+
+    report(results, last_entry(args.history))
+    if not args.no_save:
+        entry = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "machine": f"{platform.machine()} {platform.processor()} x{os.cpu_count()}",
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "results": {name: list(value) for name, value in results.items()},
+        }
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    main()
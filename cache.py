@@ -0,0 +1,243 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import numpy as np
+from checkpoint import save_checkpoint, load_checkpoint
+from config import build_state
+
+# Source files whose contents decide the result of a run
+SIMULATION_FILES = ("agent.py", "petri.py", "population.py", "kernels.py", "rng.py", "spatial.py", "simstate.py")
+# Config keys that only say how far a run goes, not where it goes
+STOP_KEYS = ("max_iters", "max_agents")
+
+
+def _file_hash(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Hash of the simulation code, so results of older code are never reused
+def code_version(files=SIMULATION_FILES):
+    folder = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name in files:
+        digest.update(_file_hash(os.path.join(folder, name)).encode())
+    return digest.hexdigest()[:16]
+
+
+# Contents of analysis arguments and results as JSON, arrays included
+def _encode(value):
+    if isinstance(value, np.ndarray):
+        return {"__array__": value.tolist(), "dtype": value.dtype.str}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if "__array__" in value:
+            return np.array(value["__array__"], dtype=value["dtype"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _argument_hash(digest, value):
+    if isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    else:
+        digest.update(json.dumps(_encode(value), sort_keys=True).encode())
+
+
+# On-disk cache of simulation states and analysis results, addressed by the
+# hash of what produced them. A run is stored under the hash of its config
+# (everything but max_iters/max_agents) and the simulation code, as
+# checkpoints every `checkpoint_interval` iterations plus its final state, so
+# a longer run of the same config resumes from the nearest cached state.
+# Analyses (memo) are stored under the hash of the function's source and its
+# arguments' contents. Files used least recently are deleted once the cache
+# grows past `max_bytes`.
+class ResultCache:
+    def __init__(self, path="cache", max_bytes=2 * 1024 ** 3, checkpoint_interval=10000):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.checkpoint_interval = checkpoint_interval
+        self.version = code_version()
+
+    # Key of the run a config describes
+    def run_key(self, config):
+        if config["workers"] > 1:
+            raise ValueError("Runs over more than one worker cannot be cached (no checkpoints)")
+        identity = {key: value for key, value in config.items() if key not in STOP_KEYS}
+        text = json.dumps({"config": identity, "code": self.version}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()[:20]
+
+    def _run_folder(self, key):
+        return os.path.join(self.path, "runs", key)
+
+    # Cached states of a run as (iteration, agents, agents_before) from their
+    # checkpoint meta, agents_before being the count the last step started from
+    def cached_states(self, key):
+        folder = self._run_folder(key)
+        if not os.path.isdir(folder):
+            return []
+        states = []
+        for name in os.listdir(folder):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                with np.load(os.path.join(folder, name), allow_pickle=False) as data:
+                    meta = json.loads(str(data["meta"]))
+            except (OSError, ValueError, KeyError):
+                continue
+            states.append((meta["iteration"], meta["agents"], meta["agents_before"]))
+        return sorted(states)
+
+    # State of the run described by `config` once it has stopped (at
+    # max_iters, or on reaching max_agents, as the headless and sweep loops
+    # do), taken from the cache or stepped from the latest cached state the
+    # run passes through. Agents are never removed, so a cached state lies on
+    # the way to the stop whenever the step into it started below max_agents.
+    def run(self, config):
+        key = self.run_key(config)
+        max_iters, max_agents = config["max_iters"], config["max_agents"]
+        on_the_way = [(iteration, agents) for iteration, agents, before in self.cached_states(key)
+                      if iteration <= max_iters and (iteration == 0 or before < max_agents)]
+        if on_the_way:
+            iteration, agents = on_the_way[-1]
+            state = self._load(key, iteration)
+            if state is not None:
+                state.max_iters = max_iters
+                if iteration == max_iters or agents >= max_agents:
+                    return state
+            else:
+                state = build_state(config)
+        else:
+            state = build_state(config)
+        return self._step(key, state, max_agents)
+
+    def _step(self, key, state, max_agents):
+        state.paused = False
+        agents = before = state.agent_count()
+        while state.iteration < state.max_iters and agents < max_agents:
+            before = agents
+            state.update()
+            agents = state.agent_count()
+            if self.checkpoint_interval and state.iteration % self.checkpoint_interval == 0:
+                self._store(key, state, before)
+        if not os.path.exists(self._state_file(key, state.iteration)):
+            self._store(key, state, before)
+        return state
+
+    def _state_file(self, key, iteration):
+        return os.path.join(self._run_folder(key), f"state_{iteration}.npz")
+
+    def _store(self, key, state, agents_before):
+        os.makedirs(self._run_folder(key), exist_ok=True)
+        save_checkpoint(state, self._state_file(key, state.iteration), {"agents_before": agents_before})
+        self.evict()
+
+    def _load(self, key, iteration):
+        filename = self._state_file(key, iteration)
+        try:
+            state = load_checkpoint(filename)
+        except (OSError, ValueError, KeyError):
+            return None
+        _touch(filename)
+        return state
+
+    # fn(*args), cached under the hash of fn's source file, its name and the
+    # contents of args (arrays, numbers, strings and lists/dicts of them).
+    # Results are stored as JSON, so they must be made of the same.
+    def memo(self, fn, *args):
+        digest = hashlib.sha256(f"{fn.__module__}.{fn.__qualname__}".encode())
+        digest.update(_file_hash(inspect.getsourcefile(fn)).encode())
+        for arg in args:
+            _argument_hash(digest, arg)
+        filename = os.path.join(self.path, "analyses", f"{digest.hexdigest()[:24]}.json")
+        try:
+            with open(filename, 'r') as f:
+                result = _decode(json.load(f))
+            _touch(filename)
+            return result
+        except (OSError, ValueError):
+            pass
+        result = fn(*args)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = f"{filename}.tmp{os.getpid()}"
+        with open(tmp, 'w') as f:
+            json.dump(_encode(result), f)
+        os.replace(tmp, filename)
+        self.evict()
+        return result
+
+    # Every cached file as (last use, size, path)
+    def entries(self):
+        entries = []
+        for folder, _, names in os.walk(self.path):
+            for name in names:
+                filename = os.path.join(folder, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        return sorted(entries)
+
+    # Delete the least recently used files until the cache fits in max_bytes
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, filename in self.entries():
+            os.remove(filename)
+
+
+# Mark a file as just used, for LRU eviction
+def _touch(filename):
+    try:
+        os.utime(filename)
+    except OSError:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show, trim or clear the result cache.')
+    parser.add_argument('--path', default='cache')
+    parser.add_argument('--max-mb', type=float, help='Evict least recently used files down to this size')
+    parser.add_argument('--clear', action='store_true')
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(args.path)
+    if args.clear:
+        cache.clear()
+    elif args.max_mb is not None:
+        cache.max_bytes = args.max_mb * 1024 ** 2
+        cache.evict()
+    entries = cache.entries()
+    runs = os.path.join(args.path, "runs")
+    print(f"{len(os.listdir(runs)) if os.path.isdir(runs) else 0} runs, {len(entries)} files, "
+          f"{sum(size for _, size, _ in entries) / 1024 ** 2:.1f} MB in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
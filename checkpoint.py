@@ -0,0 +1,123 @@
+import json
+import os
+import numpy as np
+from agent import Agent
+from simstate import SimulationState
+
+# Per-agent fields needed to continue a run exactly
+AGENT_FIELDS = ("x", "y", "mass", "theta", "time_to_change", "imotile")
+
+
+# Write the complete state of a simulation (parameters, nutrient grid, every
+# agent field and the random stream) to a compressed .npz file. The file is
+# written next to its destination first and then moved into place, so a
+# crash mid-write never leaves a broken checkpoint behind. Entries of `extra`
+# are added to the stored meta.
+def save_checkpoint(state, filename, extra=None):
+    petri = state.petri
+    rng = state.rng
+    meta = {
+        "grid_size": state.grid_size,
+        "agent_params": state.agent_params,
+        "c_max": state.c_max,
+        "d_c": state.d_c,
+        "time_step": state.time_step,
+        "seed": state.seed,
+        "num_agents": state.num_agents,
+        "max_iters": state.max_iters,
+        "engine": state.engine,
+        "diffusion": state.diffusion,
+        "active_region": state.active_region,
+        "spatial_index": state.spatial_index,
+        "dormancy": state.dormancy,
+        "precision": state.precision,
+        "iteration": state.iteration,
+        "agents": state.agent_count(),
+        "substeps": petri.substeps,
+        "active_window": petri.active_window,
+        "rng_state": rng.generator.bit_generator.state,
+        "rng_block_size": rng.block_size,
+        "rng_positions": rng.positions,
+    }
+    meta.update(extra or {})
+    arrays = {"nutrient_grid": petri.nutrient_grid}
+    for kind in rng.KINDS:
+        arrays[f"rng_{kind}"] = rng.buffers[kind]
+    for field, values in zip(AGENT_FIELDS, _agent_fields(state)):
+        arrays[f"agent_{field}"] = values
+    arrays["agent_dormant"] = _dormant_flags(state)
+
+    tmp = f"{filename}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp, filename)
+
+
+# Active agents first, then dormant ones
+def _agent_fields(state):
+    if state.population is not None:
+        fields = state.population.all_fields()
+        return [fields[field] for field in AGENT_FIELDS]
+    agents = state.petri.agents + state.dormant_agents
+    return [np.array([getattr(agent, field) for agent in agents]) for field in AGENT_FIELDS]
+
+
+def _dormant_flags(state):
+    active = len(state.population) if state.population is not None else len(state.petri.agents)
+    return np.arange(state.agent_count()) >= active
+
+
+# Rebuild a SimulationState from a checkpoint. Stepping the restored state
+# gives exactly the same results as the original run would have.
+def load_checkpoint(filename):
+    with np.load(filename, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        arrays = {key: data[key] for key in data.files if key != "meta"}
+
+    state = SimulationState(meta["grid_size"], meta["agent_params"], meta["c_max"], meta["d_c"],
+                            meta["time_step"], meta["seed"], meta["num_agents"], meta["max_iters"],
+                            engine=meta["engine"], diffusion=meta["diffusion"],
+                            active_region=meta["active_region"], spatial_index=meta["spatial_index"],
+                            dormancy=meta.get("dormancy"), precision=meta.get("precision", "float64"))
+    petri = state.petri
+    petri.substeps = meta["substeps"]
+    petri.nutrient_grid[:] = arrays["nutrient_grid"]
+    petri.active_window = tuple(meta["active_window"]) if meta["active_window"] is not None else None
+    if petri.index is not None:
+        petri.index.clear()
+
+    # Agents are recreated first (which draws from the stream) and the
+    # stream is restored afterwards
+    fields = {field: arrays[f"agent_{field}"] for field in AGENT_FIELDS}
+    dormant = arrays.get("agent_dormant", np.zeros(len(fields["x"]), dtype=bool))
+    if state.population is not None:
+        state.population.n = 0
+        state.population.add_agents(fields["x"], fields["y"], fields["mass"])
+        n = len(state.population)
+        state.population.theta[:n] = fields["theta"]
+        state.population.time_to_change[:n] = fields["time_to_change"]
+        state.population.imotile[:n] = fields["imotile"]
+        if dormant.any():
+            state.population.dormant.insert_agents(state.population.remove_agents(np.flatnonzero(dormant)))
+    else:
+        petri.agents = []
+        for i in range(len(fields["x"])):
+            agent = Agent(float(fields["x"][i]), float(fields["y"][i]), float(fields["mass"][i]), petri,
+                          state.shared_agent_params)
+            agent.theta = float(fields["theta"][i])
+            agent.time_to_change = int(fields["time_to_change"][i])
+            agent.imotile = bool(fields["imotile"][i])
+            petri.add_agent(agent)
+        if dormant.any():
+            state._set_dormant([agent for agent, flag in zip(petri.agents, dormant) if flag])
+            petri.agents = [agent for agent, flag in zip(petri.agents, dormant) if not flag]
+
+    rng = state.rng
+    rng.generator.bit_generator.state = meta["rng_state"]
+    rng.block_size = meta["rng_block_size"]
+    rng.positions = meta["rng_positions"]
+    for kind in rng.KINDS:
+        rng.buffers[kind] = arrays[f"rng_{kind}"]
+
+    state.iteration = meta["iteration"]
+    return state
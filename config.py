@@ -0,0 +1,111 @@
+import json
+import math
+import numpy.random as npr
+from simstate import SimulationState
+from decomposed import DecomposedSimulation
+from ensemble import Ensemble
+
+# Default run configuration, shared by the pygame app and headless runs
+DEFAULTS = {
+    # Nutrient Grid Parameters:
+    "grid_size": 512,   # Square grid dimensions
+    "time_step": 1,     # Stepwise diffusion rate per loop iteration
+    "c_max": 1.0,       # Max nutrient val on a given square
+    "d_c": 0.05,        # rate of diffusion
+
+    "agent_params": {
+        "r_max": 0.0498,
+        "K_m": 0.25,
+        "m_min": 1,
+        "delta_H": 10,
+        "F_d": 0.5,
+        "mu": 0.8,
+        "p": 0.02,
+        "density": 0.08,
+    },
+
+    # Simulation Parameters:
+    "seed": None,           # None picks a random seed in [0, 100)
+    "max_iters": 300000,    # Number of loop iterations for simulation
+    "max_agents": 30000,
+    "num_agents": 50,       # Initial cell count
+    "engine": "vector",     # 'object', 'vector' or 'jit'
+    "diffusion": "stencil", # 'convolve', 'stencil', 'substep', 'implicit' or 'jit'
+    "active_region": True,
+    "spatial_index": None,
+    "dormancy": None,       # nutrient level below which imotile agents go dormant, None = off
+    "workers": 1,           # >1 splits the dish over worker processes (vector engine, stencil diffusion)
+    "precision": "float64", # nutrient grid dtype, 'float32' for half the memory
+}
+
+
+# Defaults updated with a JSON config file and/or a dict of overrides
+# (agent_params entries are merged rather than replaced)
+def load_config(path=None, overrides=None):
+    config = json.loads(json.dumps(DEFAULTS))
+    for update in (_read_json(path) if path else {}, overrides or {}):
+        for key, value in update.items():
+            if key not in config:
+                raise ValueError(f"Invalid config key: {key}")
+            if key == "agent_params":
+                for param in value:
+                    if param not in config["agent_params"]:
+                        raise ValueError(f"Invalid agent parameter: {param}")
+                config["agent_params"].update(value)
+            else:
+                config[key] = value
+    if config["seed"] is None:
+        config["seed"] = int(npr.randint(0, 100))
+    return config
+
+
+def _read_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+# Build a SimulationState from a config dict (a DecomposedSimulation, which
+# must be closed after use, when it asks for more than one worker)
+def build_state(config):
+    if config["workers"] > 1:
+        if config["engine"] != "vector" or config["diffusion"] != "stencil" or not config["active_region"]:
+            raise ValueError("Decomposed runs only support the vector engine with stencil diffusion and active_region")
+        if config["dormancy"] is not None or config["spatial_index"]:
+            raise ValueError("Decomposed runs support neither dormancy nor a spatial index")
+        if config["precision"] != "float64":
+            raise ValueError("Decomposed runs only support float64 nutrient grids")
+        return DecomposedSimulation(config["grid_size"], config["agent_params"], config["c_max"], config["d_c"],
+                                    config["time_step"], config["seed"], config["num_agents"],
+                                    config["max_iters"], workers=config["workers"])
+    return SimulationState(config["grid_size"], config["agent_params"], config["c_max"], config["d_c"],
+                           config["time_step"], config["seed"], config["num_agents"], config["max_iters"],
+                           engine=config["engine"], diffusion=config["diffusion"],
+                           active_region=config["active_region"], spatial_index=config["spatial_index"],
+                           dormancy=config["dormancy"], precision=config["precision"])
+
+
+# Build an Ensemble with one replica per seed from a config dict (ensembles
+# are always the vector engine with stencil diffusion)
+def build_ensemble(config, seeds):
+    if config["engine"] != "vector" or config["diffusion"] != "stencil":
+        raise ValueError("Ensembles only support the vector engine with stencil diffusion")
+    if config["dormancy"] is not None or config["spatial_index"] or config["workers"] > 1:
+        raise ValueError("Ensembles support neither dormancy, a spatial index nor more than one worker")
+    if config["precision"] != "float64":
+        raise ValueError("Ensembles only support float64 nutrient grids")
+    return Ensemble(config["grid_size"], config["agent_params"], config["c_max"], config["d_c"],
+                    config["time_step"], seeds, config["num_agents"], config["max_iters"],
+                    max_agents=config["max_agents"], active_region=config["active_region"])
+
+
+# Dimensionless groups A-E of the model (shown in the pygame UI panel)
+def dimensionless_groups(agent_params, c_max, d_c):
+    min_r = math.sqrt((agent_params["m_min"]/agent_params["density"])/math.pi)
+    v_max = (agent_params["F_d"]/(4*math.pi*agent_params["mu"]*min_r))
+    return {
+        "A": agent_params["K_m"]/c_max,
+        "B": (agent_params["r_max"]*min_r)/(c_max*v_max),
+        "C": (min_r*agent_params["p"]*agent_params["r_max"])/(v_max*agent_params["density"]),
+        "D": (d_c)/(min_r*v_max),
+        "E": (agent_params["F_d"]*min_r)/(agent_params["m_min"]*agent_params["delta_H"]),
+    }
@@ -0,0 +1,332 @@
+import contextlib
+import multiprocessing as mp
+import pickle
+import queue
+import threading
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from agent_data import save_agents
+from petri import Petri, stencil_laplacian
+from population import Population, FIELDS
+from rng import RandomStream
+
+
+# Row ranges [start, end) of `workers` strips of a grid_size grid, as equal as
+# possible. Strips run along the first (x) axis of the nutrient grid.
+def strip_bounds(grid_size, workers):
+    edges = np.linspace(0, grid_size, workers + 1).round().astype(int)
+    return [(int(edges[i]), int(edges[i + 1])) for i in range(workers)]
+
+
+# Owner of each row, for an array of rows
+def strip_owner(rows, bounds):
+    starts = np.array([start for start, _ in bounds])
+    return np.searchsorted(starts, rows, side='right') - 1
+
+
+# The part of the dish one worker owns: rows start:end of the shared nutrient
+# grid. It stands in for Petri as far as Population is concerned (the full
+# grid is visible, but its agents only ever touch their own rows) and runs
+# the stencil diffusion of its rows with an active window like Petri's,
+# using copies of the neighbouring rows ("halo") taken before anyone updates.
+class Tile:
+    consume_nutrients = Petri.consume_nutrients
+    mark_dirty = Petri.mark_dirty
+
+    def __init__(self, grid, rows, C_max, D_c, time_step, rng):
+        self.nutrient_grid = grid
+        self.grid_size = len(grid)
+        self.rows = rows
+        self.C_max = C_max
+        self.D_c = D_c
+        self.time_step = time_step
+        self.rng = rng
+        self.index = None
+        self.active_region = True
+        self.active_window = None
+        self.halo_above = None
+        self.halo_below = None
+
+    # Copy the neighbouring rows; every tile must do this before any updates
+    def read_halo(self):
+        start, end = self.rows
+        grid = self.nutrient_grid
+        self.halo_above = grid[start - 1].copy() if start > 0 else None
+        self.halo_below = grid[end].copy() if end < self.grid_size else None
+
+    def diffuse(self):
+        start, end = self.rows
+        # Neighbouring cells off the plateau change this tile's edge rows
+        for halo, row in ((self.halo_above, start), (self.halo_below, end - 1)):
+            if halo is not None:
+                changed = np.flatnonzero(halo != self.C_max)
+                if len(changed):
+                    self.mark_dirty(row, row + 1, changed[0], changed[-1] + 1)
+        region = self._grow_active_window()
+        if region is None:
+            return
+
+        r0, r1, c0, c1 = region
+        n = self.grid_size
+        pr0, pr1, pc0, pc1 = max(r0 - 1, 0), min(r1 + 1, n), max(c0 - 1, 0), min(c1 + 1, n)
+        source = np.empty((pr1 - pr0, pc1 - pc0))
+        own0, own1 = max(pr0, start), min(pr1, end)
+        source[own0 - pr0:own1 - pr0] = self.nutrient_grid[own0:own1, pc0:pc1]
+        if pr0 < start:
+            source[0] = self.halo_above[pc0:pc1]
+        if pr1 > end:
+            source[-1] = self.halo_below[pc0:pc1]
+        lap = stencil_laplacian(source, np.empty_like(source))[r0 - pr0:r1 - pr0, c0 - pc0:c1 - pc0]
+        lap *= self.time_step * self.D_c
+        self.nutrient_grid[r0:r1, c0:c1] += lap
+
+    # Petri._grow_active_window with the rows kept inside the tile
+    def _grow_active_window(self):
+        if self.active_window is None:
+            return None
+        r0, r1, c0, c1 = self.active_window
+        start, end = self.rows
+        grid = self.nutrient_grid
+        n = self.grid_size
+        if r0 > start and np.any(grid[r0, c0:c1] != self.C_max):
+            r0 -= 1
+        if r1 < end and np.any(grid[r1 - 1, c0:c1] != self.C_max):
+            r1 += 1
+        if c0 > 0 and np.any(grid[r0:r1, c0] != self.C_max):
+            c0 -= 1
+        if c1 < n and np.any(grid[r0:r1, c1 - 1] != self.C_max):
+            c1 += 1
+        self.active_window = (r0, r1, c0, c1)
+        return self.active_window
+
+
+# One simulation step of a worker: agents, migration of agents that left the
+# tile to the neighbouring workers, then diffusion in lockstep with the others
+def _step(rank, tile, population, bounds, inboxes, barrier):
+    population.step()
+
+    start, end = tile.rows
+    rows = np.rint(population.x[:population.n]).astype(np.intp)
+    leaving = np.flatnonzero((rows < start) | (rows >= end))
+    migrants = population.remove_agents(leaving)
+    owners = strip_owner(np.rint(migrants["x"]).astype(np.intp), bounds)
+    neighbours = [r for r in (rank - 1, rank + 1) if 0 <= r < len(bounds)]
+    for neighbour in neighbours:
+        mine = owners == neighbour
+        inboxes[neighbour].put({name: values[mine] for name, values in migrants.items()})
+    for _ in neighbours:
+        population.insert_agents(_receive(inboxes[rank], barrier))
+
+    # Everyone has finished eating before halos are read, and everyone has
+    # read their halos before anyone diffuses
+    barrier.wait()
+    tile.read_halo()
+    barrier.wait()
+    tile.diffuse()
+
+
+# Agents sent by a neighbour, or BrokenBarrierError once another worker has
+# failed (it will never send them)
+def _receive(inbox, barrier):
+    while True:
+        try:
+            return inbox.get(timeout=0.1)
+        except queue.Empty:
+            if barrier.broken:
+                raise threading.BrokenBarrierError
+
+
+# Worker process. Replies are (rank, "ok", value); on an error the worker
+# replies (rank, "error", exception), breaks the barrier so the other workers
+# stop too, and exits.
+def _worker(rank, bounds, shm_name, grid_size, agent_params, c_max, d_c, time_step, seed, agents,
+            commands, results, inboxes, barrier):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    grid = np.ndarray((grid_size, grid_size), dtype=float, buffer=shm.buf)
+    try:
+        tile = Tile(grid, bounds[rank], c_max, d_c, time_step, RandomStream(seed))
+        population = Population(tile, agent_params)
+        population.insert_agents(agents)
+        while True:
+            command, argument = commands.get()
+            if command == "step":
+                for _ in range(argument):
+                    _step(rank, tile, population, bounds, inboxes, barrier)
+                results.put((rank, "ok", population.n))
+            elif command == "agents":
+                n = population.n
+                results.put((rank, "ok", {name: getattr(population, name)[:n].copy() for name in FIELDS}))
+            else:
+                break
+    except Exception as error:
+        results.put((rank, "error", _portable(error)))
+        barrier.abort()
+    finally:
+        tile = population = None
+        del grid
+        shm.close()
+
+
+# The exception itself if it can be sent to the main process, otherwise a
+# RuntimeError carrying its traceback
+def _portable(error):
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError("Worker failed:\n" + "".join(traceback.format_exception(error)))
+
+
+# A simulation split over `workers` processes. The nutrient grid lives in
+# shared memory and is cut into strips of rows; each worker steps the agents
+# in its strip as a Population, diffuses its rows (stencil backend with an
+# active window) after exchanging one halo row with each neighbour, and
+# hands agents that cross into another strip to that worker. Every worker
+# draws from its own random stream, so results match a single-process run
+# statistically rather than exactly. Has the parts of the SimulationState
+# interface used by headless runs, recorders and savers; call close() when done.
+class DecomposedSimulation:
+    def __init__(self, grid_size, agent_params, c_max, d_c, time_step, seed, num_agents, max_iters, workers=2):
+        if grid_size < 2 * workers:
+            raise ValueError(f"Grid of {grid_size} rows is too small for {workers} workers")
+        self.grid_size = grid_size
+        self.agent_params = agent_params.copy()
+        self.c_max = c_max
+        self.d_c = d_c
+        self.time_step = time_step
+        self.seed = seed
+        self.num_agents = num_agents
+        self.max_iters = max_iters
+        self.workers = workers
+        self.engine = "vector"
+        self.diffusion = "stencil"
+        self.active_region = True
+        self.iteration = 0
+        self.paused = True
+        self.running = True
+        self.pre_step_hooks = []
+        self.post_step_hooks = []
+        self.observers = []
+        self.profiler = None
+
+        self.shm = shared_memory.SharedMemory(create=True, size=grid_size * grid_size * 8)
+        grid = np.ndarray((grid_size, grid_size), dtype=float, buffer=self.shm.buf)
+        grid[:] = c_max
+        # The whole dish as one tile, for reading the grid from this process
+        rng = RandomStream(seed)
+        self.petri = Tile(grid, (0, grid_size), c_max, d_c, time_step, rng)
+
+        # Starting agents are placed as in SimulationState._init_petri
+        center = grid_size // 2
+        x = center + rng.uniform(-25, 25, num_agents).astype(int)
+        y = center + rng.uniform(-25, 25, num_agents).astype(int)
+        starting = Population(self.petri, self.agent_params)
+        starting.add_agents(x, y, np.full(num_agents, float(self.agent_params["m_min"])))
+
+        bounds = strip_bounds(grid_size, workers)
+        owners = strip_owner(np.rint(starting.x[:starting.n]).astype(np.intp), bounds)
+        seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(workers)]
+        self.counts = [0] * workers
+        self.commands = [mp.Queue() for _ in range(workers)]
+        self.results = mp.Queue()
+        inboxes = [mp.Queue() for _ in range(workers)]
+        self.failed = False
+        self.barrier = barrier = mp.Barrier(workers)
+        self.processes = []
+        for rank in range(workers):
+            mine = owners == rank
+            agents = {name: getattr(starting, name)[:starting.n][mine] for name in FIELDS}
+            self.counts[rank] = int(np.count_nonzero(mine))
+            process = mp.Process(target=_worker, daemon=True,
+                                 args=(rank, bounds, self.shm.name, grid_size, self.agent_params, c_max, d_c,
+                                       time_step, seeds[rank], agents, self.commands[rank], self.results,
+                                       inboxes, barrier))
+            process.start()
+            self.processes.append(process)
+
+    # Send a command to every worker and collect their replies. If a worker
+    # fails, the others are stopped and its exception is raised here; a worker
+    # that exits without replying raises a RuntimeError.
+    def _ask(self, command, argument=None):
+        for commands in self.commands:
+            commands.put((command, argument))
+        replies, errors = {}, {}
+        while len(replies) + len(errors) < self.workers:
+            try:
+                rank, status, value = self.results.get(timeout=0.1)
+            except queue.Empty:
+                for rank, process in enumerate(self.processes):
+                    if rank not in replies and rank not in errors and not process.is_alive():
+                        self.failed = True
+                        self.barrier.abort()
+                        raise RuntimeError(f"Worker {rank} exited (exit code {process.exitcode})")
+                continue
+            if status == "error":
+                errors[rank] = value
+            else:
+                replies[rank] = value
+        if errors:
+            self.failed = True
+            # Workers stopped by the broken barrier only report the failure
+            causes = [error for error in errors.values() if not isinstance(error, threading.BrokenBarrierError)]
+            raise (causes or list(errors.values()))[0]
+        return [replies[rank] for rank in range(self.workers)]
+
+    # Advance every worker by `steps` steps without stopping in between
+    def advance(self, steps):
+        self.counts = self._ask("step", steps)
+        self.iteration += steps
+
+    # Make a step in the simulation
+    def update(self):
+        if self.paused:
+            return
+        for hook in self.pre_step_hooks:
+            hook(self)
+        self.advance(1)
+        for hook in self.post_step_hooks:
+            hook(self)
+        for observer in self.observers:
+            observer.observe(self)
+
+    # Profiling covers a single process, phases are not timed here
+    def phase(self, name):
+        return contextlib.nullcontext()
+
+    def agent_count(self):
+        return sum(self.counts)
+
+    # Agent fields gathered from every worker
+    def agent_fields(self):
+        parts = self._ask("agents")
+        return {name: np.concatenate([part[name] for part in parts]) for name in FIELDS}
+
+    def agent_arrays(self):
+        fields = self.agent_fields()
+        return fields["x"], fields["y"], fields["mass"], fields["imotile"]
+
+    # Agent data as .npz columns (see agent_data.save_agents)
+    def save_data(self, filename):
+        if not filename.endswith(".npz"):
+            raise ValueError("Decomposed runs save agent data as .npz only")
+        save_agents(self, filename)
+
+    # Stop the workers and free the shared grid (the grid is copied out first).
+    # After a failure, workers that do not exit within a second are
+    # terminated: a killed worker can leave a queue's lock held, so the others
+    # may never finish flushing their replies.
+    def close(self):
+        if self.shm is None:
+            return
+        for commands in self.commands:
+            commands.put(("stop", None))
+        for process in self.processes:
+            process.join(1 if self.failed else None)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.petri.nutrient_grid = self.petri.nutrient_grid.copy()
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
@@ -0,0 +1,265 @@
+import numpy as np
+from petri import Petri, stencil_laplacian
+from population import Population, FIELDS
+from rng import RandomStream
+
+
+# The nutrient grids of every replica as one (replicas, N, N) array. Agents
+# see it through `nutrient_grid`, the same memory as a (replicas * N, N)
+# grid where replica r owns rows r*N to (r+1)*N, so Population code and
+# Petri.consume_nutrients work on it unchanged. Active windows are kept per
+# replica by the Ensemble, so the stacked grid itself never marks anything.
+class StackedDish:
+    consume_nutrients = Petri.consume_nutrients
+
+    def __init__(self, replicas, grid_size, C_max, D_c, time_step):
+        self.grid_size = grid_size
+        self.C_max = C_max
+        self.D_c = D_c
+        self.time_step = time_step
+        self.grids = np.full((replicas, grid_size, grid_size), C_max, dtype=float)
+        self.nutrient_grid = self.grids.reshape(replicas * grid_size, grid_size)
+        self.index = None
+        self.active_region = False
+
+
+# Population of every replica in one set of arrays. Agents carry the
+# replica they belong to and are kept grouped by replica, in the order the
+# replica's own Population would have them, and random numbers come from the
+# replica's own stream in the same order, so each replica steps exactly like
+# an independent vector-engine run with its seed.
+class EnsemblePopulation(Population):
+    fields = FIELDS + ("replica",)
+
+    def __init__(self, dish, params, rngs, capacity=1024):
+        super().__init__(dish, params, capacity)
+        self.replica = np.empty(capacity, dtype=np.int64)
+        self.rngs = rngs
+
+    # Rows of the stacked grid, and columns, of each agent's cell
+    def cells(self):
+        n = self.n
+        return (self.replica[:n] * self.petri.grid_size + np.rint(self.x[:n]).astype(np.intp),
+                np.rint(self.y[:n]).astype(np.intp))
+
+    # Positions in `indices` (sorted, as are the replica ids) where each
+    # replica's agents start, for replicas 0..len(rngs)
+    def _segments(self, indices):
+        return np.searchsorted(self.replica[indices], np.arange(len(self.rngs) + 1))
+
+    def turn(self, turning):
+        bounds = self._segments(turning)
+        for r, rng in enumerate(self.rngs):
+            mine = turning[bounds[r]:bounds[r + 1]]
+            if len(mine):
+                self.theta[mine] = rng.thetas(len(mine))
+                self.time_to_change[mine] = rng.run_lengths(len(mine))
+
+    # New agents of replica r, after its existing agents
+    def add_replica_agents(self, r, x, y, mass):
+        count = len(x)
+        rng = self.rngs[r]
+        self._insert_grouped({"x": x, "y": y, "mass": mass, "theta": rng.thetas(count),
+                              "time_to_change": rng.run_lengths(count), "imotile": np.zeros(count, dtype=bool),
+                              "replica": np.full(count, r)})
+
+    # Insert agents (sorted by replica) at the end of their replica's group
+    def _insert_grouped(self, fields):
+        n = self.n
+        positions = np.searchsorted(self.replica[:n], fields["replica"], side='right')
+        merged = {name: np.insert(getattr(self, name)[:n], positions, fields[name]) for name in self.fields}
+        self._reserve(len(merged["x"]))
+        for name in self.fields:
+            getattr(self, name)[:len(merged[name])] = merged[name]
+        self.n = len(merged["x"])
+
+    def replicate(self):
+        n = self.n
+        mass = self.mass[:n]
+        parents = np.flatnonzero(~self.imotile[:n] & (mass >= self.m_max))
+        if len(parents) == 0:
+            return
+
+        limit = self.petri.grid_size - 1
+        bounds = self._segments(parents)
+        born = []
+        for r, rng in enumerate(self.rngs):
+            mine = parents[bounds[r]:bounds[r + 1]]
+            if len(mine) == 0:
+                continue
+            # Same draws, in the same order, as Population.replicate and
+            # add_agents in an independent run
+            dx, dy = rng.directions(len(mine))
+            mass[mine] /= 2
+            count = len(mine)
+            born.append({"x": np.clip(self.x[mine] + dx, 0, limit), "y": np.clip(self.y[mine] + dy, 0, limit),
+                         "mass": mass[mine], "theta": rng.thetas(count), "time_to_change": rng.run_lengths(count),
+                         "imotile": np.zeros(count, dtype=bool), "replica": np.full(count, r)})
+        self._insert_grouped({name: np.concatenate([part[name] for part in born]) for name in self.fields})
+
+    # Agents of replica r, removed from the population
+    def remove_replica(self, r):
+        bounds = self._segments(np.arange(self.n))
+        return self.remove_agents(np.arange(bounds[r], bounds[r + 1]))
+
+
+# R replicas of one parameter set, differing only in their seeds, stepped
+# together: one (R, N, N) nutrient array diffused by a single stencil call
+# and one EnsemblePopulation holding every replica's agents. Each replica
+# gives exactly the results of a SimulationState with engine="vector",
+# diffusion="stencil" and its seed. A replica stops stepping once it reaches
+# `max_agents` agents, or when max_iters is reached; its final state is then
+# kept in `results` (seed, iteration, nutrient_grid and the agent fields).
+class Ensemble:
+    def __init__(self, grid_size, agent_params, c_max, d_c, time_step, seeds, num_agents, max_iters,
+                 max_agents=None, active_region=True):
+        self.grid_size = grid_size
+        self.agent_params = agent_params.copy()
+        self.c_max = c_max
+        self.d_c = d_c
+        self.time_step = time_step
+        self.seeds = list(seeds)
+        self.replicas = len(self.seeds)
+        self.num_agents = num_agents
+        self.max_iters = max_iters
+        self.max_agents = max_agents
+        self.active_region = active_region
+        self.iteration = 0
+        self.paused = True
+
+        self.petri = StackedDish(self.replicas, grid_size, c_max, d_c, time_step)
+        rngs = [RandomStream(seed) for seed in self.seeds]
+        self.population = EnsemblePopulation(self.petri, self.agent_params, rngs)
+        # Starting agents are placed as in SimulationState._init_petri
+        center = grid_size // 2
+        for r, rng in enumerate(rngs):
+            x = center + rng.uniform(-25, 25, num_agents).astype(int)
+            y = center + rng.uniform(-25, 25, num_agents).astype(int)
+            self.population.add_replica_agents(r, x, y, np.full(num_agents, float(self.agent_params["m_min"])))
+
+        # Active window of each replica (see Petri), None for a replica whose
+        # grid has not changed yet or that has stopped
+        self.windows = [None] * self.replicas
+        self.running = [True] * self.replicas
+        self.results = [None] * self.replicas
+        # Flat scratch space, so the Laplacian of any box is contiguous
+        self._laplacian_buffer = np.empty(self.petri.grids.size)
+
+    # Agents in each replica, stopped replicas included
+    def agent_counts(self):
+        counts = np.bincount(self.population.replica[:self.population.n], minlength=self.replicas)
+        for r, result in enumerate(self.results):
+            if result is not None:
+                counts[r] = len(result["x"])
+        return counts
+
+    # Whether every replica has stopped
+    @property
+    def finished(self):
+        return not any(self.running)
+
+    # Make a step in every replica still running
+    def update(self):
+        if self.paused:
+            return
+        self._stop_replicas()
+        if self.finished:
+            return
+        population = self.population
+        population.eat()
+        if self.active_region:
+            self._mark_eaten()
+        population.move()
+        population.replicate()
+        self.diffuse()
+        self.iteration += 1
+
+    # Step until every replica has stopped, returns `results`
+    def run(self):
+        self.paused = False
+        while not self.finished:
+            self.update()
+        return self.results
+
+    # Stop the replicas that reached max_iters or max_agents, as the run loops
+    # do before stepping
+    def _stop_replicas(self):
+        counts = self.agent_counts()
+        for r in range(self.replicas):
+            if self.running[r] and (self.iteration >= self.max_iters or
+                                    (self.max_agents is not None and counts[r] >= self.max_agents)):
+                fields = self.population.remove_replica(r)
+                del fields["replica"]
+                self.results[r] = dict(fields, seed=self.seeds[r], iteration=self.iteration,
+                                       nutrient_grid=self.petri.grids[r].copy())
+                self.running[r] = False
+                self.windows[r] = None
+
+    # Petri.consume_nutrients' dirty marking, per replica
+    def _mark_eaten(self):
+        population = self.population
+        n = population.n
+        if n == 0:
+            return
+        ix, iy = np.rint(population.x[:n]).astype(np.intp), np.rint(population.y[:n]).astype(np.intp)
+        bounds = population._segments(np.arange(n))
+        starts = bounds[:-1][bounds[:-1] < bounds[1:]]
+        replicas = population.replica[starts]
+        for r, x0, x1, y0, y1 in zip(replicas.tolist(), np.minimum.reduceat(ix, starts).tolist(),
+                                     np.maximum.reduceat(ix, starts).tolist(), np.minimum.reduceat(iy, starts).tolist(),
+                                     np.maximum.reduceat(iy, starts).tolist()):
+            window = self.windows[r]
+            if window is not None:
+                w0, w1, v0, v1 = window
+                x0, x1, y0, y1 = min(x0, w0), max(x1 + 1, w1), min(y0, v0), max(y1 + 1, v1)
+            else:
+                x1, y1 = x1 + 1, y1 + 1
+            self.windows[r] = (x0, x1, y0, y1)
+
+    # One stencil diffusion step of every running replica. With active_region
+    # the Laplacian is computed once over the box around every replica's
+    # window, but each replica is only updated inside its own window, so
+    # nothing changes where an independent run would not change it.
+    def diffuse(self):
+        grids = self.petri.grids
+        coefficient = self.time_step * self.d_c
+        if not self.active_region:
+            lap = stencil_laplacian(grids, self._laplacian_buffer.reshape(grids.shape))
+            lap *= coefficient
+            for r in range(self.replicas):
+                if self.running[r]:
+                    grids[r] += lap[r]
+            return
+
+        windows = [(r, self._grow_window(r)) for r in range(self.replicas) if self.windows[r] is not None]
+        if not windows:
+            return
+        n = self.grid_size
+        r0 = max(min(window[0] for _, window in windows) - 1, 0)
+        r1 = min(max(window[1] for _, window in windows) + 1, n)
+        c0 = max(min(window[2] for _, window in windows) - 1, 0)
+        c1 = min(max(window[3] for _, window in windows) + 1, n)
+        replicas = [r for r, _ in windows]
+        lo, hi = min(replicas), max(replicas) + 1
+        source = grids[lo:hi, r0:r1, c0:c1]
+        lap = stencil_laplacian(source, self._laplacian_buffer[:source.size].reshape(source.shape))
+        lap *= coefficient
+        for r, (w0, w1, v0, v1) in windows:
+            grids[r, w0:w1, v0:v1] += lap[r - lo, w0 - r0:w1 - r0, v0 - c0:v1 - c0]
+
+    # Petri._grow_active_window for replica r
+    def _grow_window(self, r):
+        r0, r1, c0, c1 = self.windows[r]
+        grid = self.petri.grids[r]
+        n = self.grid_size
+        c_max = self.c_max
+        if r0 > 0 and np.any(grid[r0, c0:c1] != c_max):
+            r0 -= 1
+        if r1 < n and np.any(grid[r1 - 1, c0:c1] != c_max):
+            r1 += 1
+        if c0 > 0 and np.any(grid[r0:r1, c0] != c_max):
+            c0 -= 1
+        if c1 < n and np.any(grid[r0:r1, c1 - 1] != c_max):
+            c1 += 1
+        self.windows[r] = (r0, r1, c0, c1)
+        return self.windows[r]
@@ -0,0 +1,66 @@
+import sys
+import numpy as np
+
+# Peak resident memory of the process is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Slots of an Agent that hold its own Python objects
+AGENT_VALUES = ("x", "y", "mass", "theta", "time_to_change")
+
+
+def _array_bytes(obj, skip=()):
+    return sum(value.nbytes for name, value in vars(obj).items()
+               if isinstance(value, np.ndarray) and name not in skip)
+
+
+def _agent_bytes(agent):
+    return sys.getsizeof(agent) + sum(sys.getsizeof(getattr(agent, name)) for name in AGENT_VALUES)
+
+
+# Bytes held by a simulation: the nutrient grid, the scratch arrays of the
+# dish and engine, and the agents (the allocated arrays of a Population, or
+# every Agent with the numbers it points to; shared parameters are not
+# counted), plus the peak resident size of the process where known
+def memory_footprint(state):
+    petri = state.petri
+    population = getattr(state, "population", None)
+    scratch = _array_bytes(petri, skip=("nutrient_grid",))
+    if population is not None:
+        agents = 0
+        for part in (population, population.dormant):
+            if part is not None:
+                agents += sum(getattr(part, name).nbytes for name in part.fields)
+                scratch += _array_bytes(part, skip=part.fields)
+    elif hasattr(state, "dormant_agents"):
+        agents = sum(_agent_bytes(agent) for agent in petri.agents + state.dormant_agents)
+    else:
+        # Agents held by other processes, counted as their gathered columns
+        agents = sum(values.nbytes for values in state.agent_arrays())
+    count = state.agent_count()
+    footprint = {
+        "agents": count,
+        "grid_bytes": petri.nutrient_grid.nbytes,
+        "scratch_bytes": scratch,
+        "agent_bytes": agents,
+        "bytes_per_agent": agents / count if count else 0.0,
+        "total_bytes": petri.nutrient_grid.nbytes + scratch + agents,
+    }
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        footprint["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return footprint
+
+
+# One-line summary of memory_footprint in MB
+def format_footprint(footprint):
+    mb = 1024 ** 2
+    line = (f"grid {footprint['grid_bytes'] / mb:.1f} MB, scratch {footprint['scratch_bytes'] / mb:.1f} MB, "
+            f"agents {footprint['agent_bytes'] / mb:.1f} MB ({footprint['bytes_per_agent']:.0f} B/agent), "
+            f"total {footprint['total_bytes'] / mb:.1f} MB")
+    if "peak_rss_bytes" in footprint:
+        line += f", peak RSS {footprint['peak_rss_bytes'] / mb:.1f} MB"
+    return line
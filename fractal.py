@@ -0,0 +1,176 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.stats import linregress, t as t_dist
+from agent_data import load_agents
+from cache import ResultCache
+
+# Box sizes used by fractal_analysis.ipynb
+BOX_SIZES = [1, 2, 4, 8, 16, 32]
+
+
+# Occupancy grid with a 1 in every cell holding at least one agent
+def occupancy_grid(x, y, size):
+    grid = np.zeros((size, size))
+    grid[np.asarray(x).astype(int), np.asarray(y).astype(int)] = 1
+    return grid
+
+
+# Occupancy grid of a saved agent data file (.npz, or legacy .json)
+def load_occupancy(filename, size=None):
+    params, columns = load_agents(filename, mmap=filename.endswith(".npz"))
+    size = size or params["simulation_params"]["grid_size"]
+    return occupancy_grid(columns["x"], columns["y"], size)
+
+
+# Roughly geometric box sizes from 1 to grid_size / 4, not just powers of two
+def box_sizes_for(grid_size, count=12):
+    return [int(s) for s in np.unique(np.round(np.geomspace(1, grid_size / 4, count)))]
+
+
+# Occupied boxes of one size, with the box grid shifted by (dx, dy). Boxes
+# that run past the edge count like the notebook's partial edge boxes.
+def _count_boxes(occupied, size, dx=0, dy=0):
+    rows, cols = occupied.shape
+    padded_rows = -(-(rows + dx) // size) * size
+    padded_cols = -(-(cols + dy) // size) * size
+    padded = np.zeros((padded_rows, padded_cols), dtype=bool)
+    padded[dx:dx + rows, dy:dy + cols] = occupied
+    boxes = padded.reshape(padded_rows // size, size, padded_cols // size, size)
+    return int(np.count_nonzero(boxes.any(axis=(1, 3))))
+
+
+# Counts for box sizes 1, 2, 4, ... 2**(levels-1) in one pass, OR-pooling
+# the occupancy grid 2x2 at a time
+def box_count_pyramid(grid, levels):
+    occupied = np.asarray(grid) != 0
+    counts = []
+    for level in range(levels):
+        counts.append(int(np.count_nonzero(occupied)))
+        if level + 1 < levels:
+            rows, cols = occupied.shape
+            if rows % 2 or cols % 2:
+                occupied = np.pad(occupied, ((0, rows % 2), (0, cols % 2)))
+            occupied = occupied.reshape(occupied.shape[0] // 2, 2, occupied.shape[1] // 2, 2).any(axis=(1, 3))
+    return counts
+
+
+# Number of occupied boxes for each box size. With offsets > 1 the box grid
+# is also shifted to `offsets` evenly spaced positions per axis and the
+# smallest count (the best covering) is kept for each size.
+def box_count(grid, box_sizes, offsets=1):
+    box_sizes = [int(s) for s in box_sizes]
+    levels = max(box_sizes).bit_length()
+    if offsets == 1 and all(s & (s - 1) == 0 for s in box_sizes):
+        pyramid = box_count_pyramid(grid, levels)
+        return np.array([pyramid[s.bit_length() - 1] for s in box_sizes])
+
+    occupied = np.asarray(grid) != 0
+    counts = []
+    for size in box_sizes:
+        shifts = np.unique(np.linspace(0, size, offsets, endpoint=False).astype(int))
+        counts.append(min(_count_boxes(occupied, size, dx, dy) for dx in shifts for dy in shifts))
+    return np.array(counts)
+
+
+# Summed-area table with a leading row and column of zeros, so the sum of
+# grid[r0:r1, c0:c1] is S[r1, c1] - S[r0, c1] - S[r1, c0] + S[r0, c0]
+def summed_area_table(grid):
+    table = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), dtype=np.result_type(grid.dtype, np.int64))
+    np.cumsum(grid, axis=0, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table
+
+
+# Gliding-box lacunarity (variance / mean**2 of the box masses) for every box
+# size from one integral image. Boxes are centred on every cell with zero
+# padding past the edges, the same boxes as the notebook's uniform_filter.
+def lacunarity(grid, box_sizes):
+    grid = np.asarray(grid)
+    if grid.dtype == bool or np.all(np.mod(grid, 1) == 0):
+        grid = grid.astype(np.int64)
+    pad = max(box_sizes)
+    table = summed_area_table(np.pad(grid, pad))
+    rows, cols = grid.shape
+    counts = []
+
+    for r in box_sizes:
+        start = pad - r // 2
+        r0, r1 = slice(start, start + rows), slice(start + r, start + r + rows)
+        c0, c1 = slice(start, start + cols), slice(start + r, start + r + cols)
+        values = (table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]).astype(float)
+
+        mean = np.mean(values)
+        variance = np.var(values)
+
+        lac = (variance / (mean**2))
+        counts.append(lac)
+
+    return counts
+
+
+# Least-squares fit of log(N) against log(1 / S) with a confidence interval
+# on the slope (the box-counting dimension) from the t distribution
+def fit_dimension(box_sizes, counts, confidence=0.95):
+    fit = linregress(np.log(1 / np.asarray(box_sizes, dtype=float)), np.log(counts))
+    dof = len(box_sizes) - 2
+    half_width = t_dist.ppf((1 + confidence) / 2, dof) * fit.stderr if dof > 0 else np.nan
+    return {
+        "dimension": float(fit.slope),
+        "intercept": float(fit.intercept),
+        "r2": float(fit.rvalue ** 2),
+        "stderr": float(fit.stderr),
+        "ci_low": float(fit.slope - half_width),
+        "ci_high": float(fit.slope + half_width),
+    }
+
+
+# Box-counting dimension of an occupancy grid (see fit_dimension)
+def box_count_dimension(grid, box_sizes=BOX_SIZES, offsets=1, confidence=0.95):
+    return fit_dimension(box_sizes, box_count(grid, box_sizes, offsets), confidence)
+
+
+# Lacunarity exponent: minus the slope of log(lac) against log(S)
+def lacunarity_exponent(grid, box_sizes=BOX_SIZES):
+    lac = lacunarity(grid, box_sizes)
+    fit = linregress(np.log(box_sizes), np.log(lac))
+    return -fit.slope
+
+
+def _analyse_file(args):
+    filename, box_sizes, offsets, confidence, cache_path = args
+    grid = load_occupancy(filename)
+    if cache_path:
+        result = ResultCache(cache_path).memo(box_count_dimension, grid, box_sizes, offsets, confidence)
+    else:
+        result = box_count_dimension(grid, box_sizes, offsets, confidence)
+    result["file"] = filename
+    return result
+
+
+# Box-counting dimensions of many saved runs, spread over worker processes
+# (each taken from a cache.ResultCache in `cache_path` when given, keyed by
+# the occupancy grid, so unchanged snapshots are not counted again)
+def batch_dimensions(filenames, box_sizes=BOX_SIZES, offsets=1, confidence=0.95, workers=None, cache_path=None):
+    jobs = [(filename, box_sizes, offsets, confidence, cache_path) for filename in filenames]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_analyse_file, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count())))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Box-counting dimension of saved simulation data.')
+    parser.add_argument('files', nargs='+', help='Saved agent data files (.npz or .json)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BOX_SIZES, help='Box sizes')
+    parser.add_argument('--offsets', type=int, default=1, help='Box grid offsets tried per axis')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--cache', metavar='DIR', help='Reuse results cached in DIR (see cache.py)')
+    args = parser.parse_args(argv)
+
+    for result in batch_dimensions(args.files, args.sizes, args.offsets, workers=args.workers, cache_path=args.cache):
+        print(f"{result['file']}: D = {result['dimension']:.3f} "
+              f"(95% CI {result['ci_low']:.3f} to {result['ci_high']:.3f}, R² {result['r2']:.3f})")
+
+
+if __name__ == "__main__":
+    main()
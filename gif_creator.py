@@ -1,23 +1,208 @@
 import imageio.v2 as imageio
 from natsort import natsorted
+import numpy as np
+from PIL import Image, GifImagePlugin
+from concurrent.futures import ThreadPoolExecutor
 import os
+import sys
 import argparse
+from render import PALETTE
 
-# cli
-parser = argparse.ArgumentParser(description='Create a GIF from PNG frames in a folder.')
-parser.add_argument('folder', help='Name of the folder inside figures/ to process')
-args = parser.parse_args()
+MOVIE_FORMATS = ("gif", "mp4", "webm")
+VIDEO_CODECS = {"mp4": "libx264", "webm": "libvpx-vp9"}
 
-FOLDER = args.folder
-images_path = f'figures/{FOLDER}/'
 
-#create gifs/
-os.makedirs("gifs/", exist_ok=True)
+# Writes a GIF one frame at a time: the header and global palette are written
+# with the first frame and every frame after that only adds its own image
+# data, so nothing is held in memory. All frames share the first palette.
+# The file is only created with the first frame, so a stream closed without
+# any frames leaves no (invalid) GIF behind.
+class GifStream:
+    def __init__(self, path, fps=10):
+        self.path = path
+        self.file = None
+        self.duration = int(round(1000 / fps))
+        self.palette = None
 
-with imageio.get_writer(f'gifs/{FOLDER}.gif', mode='I') as writer:
-    for image in natsorted(os.listdir(images_path)):
-        if not image.endswith('.png') or not image.startswith('frame'):
-            continue
+    # Add a 'P' mode image (converted to the stream's palette if needed)
+    def append(self, image):
+        if self.palette is None:
+            self.file = open(self.path, 'wb')
+            self.palette = image.getpalette()
+            header, _ = GifImagePlugin.getheader(image, None, {"loop": 0})
+            for block in header:
+                self.file.write(block)
+        elif image.getpalette() != self.palette:
+            image = image.convert("RGB").quantize(palette=self._palette_image(), dither=Image.Dither.NONE)
+        for block in GifImagePlugin.getdata(image, duration=self.duration):
+            self.file.write(block)
 
-        img = imageio.imread(images_path + image)
-        writer.append_data(img)
\ No newline at end of file
+    def _palette_image(self):
+        palette_image = Image.new("P", (1, 1))
+        palette_image.putpalette(self.palette)
+        return palette_image
+
+    def close(self):
+        if self.file is None:
+            print(f"[WARNING] No frames were added, {self.path} was not written")
+            return
+        self.file.write(b";")
+        self.file.close()
+        self.file = None
+
+
+# Streams frames into any mix of GIF, MP4 and WebM files as they arrive,
+# keeping every `every`-th frame and resizing by `scale`. GIF frames are
+# palette images (the dish palette, or the first frame's adaptive palette
+# for other images); MP4/WebM need the optional imageio-ffmpeg package.
+class MovieWriter:
+    def __init__(self, paths, fps=10, scale=1.0, every=1):
+        self.scale = scale
+        self.every = every
+        self.count = 0
+        self.gifs = []
+        self.videos = []
+        for path in paths:
+            ext = os.path.splitext(path)[1][1:].lower()
+            if ext not in MOVIE_FORMATS:
+                raise ValueError(f"Unsupported movie format: {path}")
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if ext == "gif":
+                self.gifs.append(GifStream(path, fps))
+            else:
+                self.videos.append(imageio.get_writer(path, fps=fps, codec=VIDEO_CODECS[ext], macro_block_size=2))
+        self.palette_image = None
+
+    # Skip frames that aren't kept (True if this one is)
+    def _keep(self):
+        self.count += 1
+        return (self.count - 1) % self.every == 0
+
+    def _resize(self, image):
+        if self.scale == 1:
+            return image
+        size = (max(1, round(image.width * self.scale)), max(1, round(image.height * self.scale)))
+        return image.resize(size, Image.NEAREST)
+
+    # Add a frame of dish palette indices indexed [x, y] (see render.render_indices)
+    def append_indices(self, indices):
+        if not self._keep():
+            return
+        image = Image.fromarray(np.ascontiguousarray(indices.T), "P")
+        image.putpalette(PALETTE.tobytes())
+        self._write(self._resize(image))
+
+    # Add an RGB image (rows x columns x 3)
+    def append_rgb(self, rgb):
+        if not self._keep():
+            return
+        self._write(self._resize(Image.fromarray(rgb).convert("RGB")))
+
+    # Add an already decoded image prepared by prepare_image
+    def append_image(self, image):
+        if not self._keep():
+            return
+        self._write(image)
+
+    def _write(self, image):
+        if self.gifs:
+            if image.mode != "P":
+                if self.palette_image is None:
+                    # Adaptive palette from the first frame, reused for the rest
+                    self.palette_image = image.quantize(256, dither=Image.Dither.NONE)
+                image_p = image.quantize(palette=self.palette_image, dither=Image.Dither.NONE)
+            else:
+                image_p = image
+            for gif in self.gifs:
+                gif.append(image_p)
+        if self.videos:
+            rgb = np.asarray(image.convert("RGB"))
+            for video in self.videos:
+                video.append_data(rgb)
+
+    def close(self):
+        for gif in self.gifs:
+            gif.close()
+        for video in self.videos:
+            video.close()
+
+
+# Decode and resize one PNG (run on worker threads)
+def prepare_image(path, scale=1.0):
+    image = Image.open(path)
+    image.load()
+    if image.mode not in ("P", "RGB"):
+        image = image.convert("RGB")
+    if scale != 1:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.NEAREST)
+    return image
+
+
+# frame_*.png files of a folder in natural order, keeping every `every`-th
+def frame_files(folder, every=1):
+    names = [name for name in natsorted(os.listdir(folder))
+             if name.endswith('.png') and name.startswith('frame')]
+    return [os.path.join(folder, name) for name in names[::every]]
+
+
+# Build movies from a folder of frames, decoding on `workers` threads. Frames
+# are decoded in batches so only a few are in memory at any time.
+def movie_from_folder(folder, paths, fps=10, scale=1.0, every=1, workers=None):
+    files = frame_files(folder, every)
+    writer = MovieWriter(paths, fps)
+    workers = workers or os.cpu_count()
+    batch = 4 * workers
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(files), batch):
+            for image in pool.map(lambda path: prepare_image(path, scale), files[start:start + batch]):
+                writer.append_image(image)
+    writer.close()
+    return len(files)
+
+
+# Build movies from raw RGB24 frames (width x height x 3 bytes each) read
+# from a binary stream, e.g. piped from another process
+def movie_from_raw(stream, width, height, paths, fps=10, scale=1.0, every=1):
+    writer = MovieWriter(paths, fps, scale, every)
+    frame_size = width * height * 3
+    count = 0
+    while True:
+        data = stream.read(frame_size)
+        if len(data) < frame_size:
+            break
+        writer.append_rgb(np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3))
+        count += 1
+    writer.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Create a GIF (or MP4/WebM) from PNG frames in a folder.')
+    parser.add_argument('folder', help='Name of the folder inside figures/ to process (or output name with --raw)')
+    parser.add_argument('--format', nargs='+', default=['gif'], choices=MOVIE_FORMATS,
+                        help='Output formats, written to gifs/<folder>.<format>')
+    parser.add_argument('--fps', type=float, default=10)
+    parser.add_argument('--every', type=int, default=1, help='Only use every N-th frame')
+    parser.add_argument('--scale', type=float, default=1.0, help='Resize frames by this factor')
+    parser.add_argument('--workers', type=int, help='Decode threads (default: all cores)')
+    parser.add_argument('--raw', metavar='WIDTHxHEIGHT',
+                        help='Read raw RGB24 frames of this size from stdin instead of a folder')
+    args = parser.parse_args(argv)
+
+    FOLDER = args.folder
+    #create gifs/
+    os.makedirs("gifs/", exist_ok=True)
+    paths = [f'gifs/{FOLDER}.{fmt}' for fmt in args.format]
+
+    if args.raw:
+        width, height = (int(v) for v in args.raw.lower().split('x'))
+        count = movie_from_raw(sys.stdin.buffer, width, height, paths, args.fps, args.scale, args.every)
+    else:
+        if not frame_files(f'figures/{FOLDER}/'):
+            parser.error(f"no frame_*.png files in figures/{FOLDER}/")
+        count = movie_from_folder(f'figures/{FOLDER}/', paths, args.fps, args.scale, args.every, args.workers)
+    print(f"Wrote {count} frames to {', '.join(paths)}")
+
+
+if __name__ == "__main__":
+    main()
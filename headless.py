@@ -0,0 +1,200 @@
+import argparse
+import datetime
+import json
+import os
+import time
+from config import DEFAULTS, load_config, build_state
+from checkpoint import save_checkpoint, load_checkpoint
+from snapshots import FrameWriter
+from gif_creator import MovieWriter
+from metrics import MetricsRecorder
+from profiler import Profiler
+from trajectory import TrajectoryRecorder
+from footprint import memory_footprint, format_footprint
+
+
+# Step a simulation to max_iters/max_agents as fast as possible, saving agent
+# data (data_<iteration>.npz, or the legacy .json with data_format="json")
+# every `snapshot_interval` iterations and once more at the end, and
+# overwriting out_dir/checkpoint.npz every `checkpoint_interval` iterations.
+# Every `frame_interval` iterations a frame_<iteration>.png image is written
+# (or, with `movies`, a frame is streamed straight into those GIF/MP4/WebM
+# files) on a background thread while the simulation keeps stepping. The
+# memory footprint of the finished run is printed and saved to memory.json.
+def run(state, max_agents, out_dir, snapshot_interval=0, log_interval=1000, checkpoint_interval=0, frame_interval=0,
+        movies=None, data_format="npz"):
+    os.makedirs(out_dir, exist_ok=True)
+    frame_writer = None
+    if frame_interval:
+        movie = MovieWriter([f"{out_dir}/{name}" for name in movies], scale=2) if movies else None
+        frame_writer = FrameWriter(movie=movie)
+    state.paused = False
+    start = time.perf_counter()
+    last_time, last_iter = start, state.iteration
+
+    try:
+        while state.iteration < state.max_iters and state.agent_count() < max_agents:
+            state.update()
+
+            if snapshot_interval and state.iteration % snapshot_interval == 0:
+                with state.phase("snapshot"):
+                    state.save_data(f"{out_dir}/data_{state.iteration}.{data_format}")
+
+            if frame_writer and state.iteration % frame_interval == 0:
+                with state.phase("frames"):
+                    frame_writer.submit(state, None if movies else f"{out_dir}/frame_{state.iteration}.png")
+
+            if checkpoint_interval and state.iteration % checkpoint_interval == 0:
+                with state.phase("checkpoint"):
+                    save_checkpoint(state, f"{out_dir}/checkpoint.npz")
+
+            if log_interval and state.iteration % log_interval == 0:
+                now = time.perf_counter()
+                rate = (state.iteration - last_iter) / (now - last_time)
+                print(f"Iteration {state.iteration}: {state.agent_count()} agents, {rate:.1f} steps/s")
+                last_time, last_iter = now, state.iteration
+    finally:
+        if frame_writer:
+            frame_writer.close()
+    state.save_data(f"{out_dir}/data_{state.iteration}.{data_format}")
+    print(f"Finished at iteration {state.iteration} with {state.agent_count()} agents "
+          f"in {time.perf_counter() - start:.1f}s, data saved to {out_dir}")
+    footprint = memory_footprint(state)
+    print(f"Memory: {format_footprint(footprint)}")
+    with open(f"{out_dir}/memory.json", 'w') as f:
+        json.dump(footprint, f, indent=4)
+    return state
+
+
+# Attach the recorders and profiler requested on the command line
+def add_observers(state, args, out_dir, resume_from=None):
+    if args.profile:
+        state.profiler = Profiler(args.profile, f"{out_dir}/profile.csv", args.profile_allocations)
+    if args.metrics_interval:
+        state.observers.append(MetricsRecorder(args.metrics_interval, f"{out_dir}/metrics.csv",
+                                               resume_from=resume_from))
+    if args.trajectory_interval:
+        state.observers.append(TrajectoryRecorder(f"{out_dir}/trajectory", args.trajectory_interval,
+                                                  args.trajectory_downsample,
+                                                  "uint8" if args.trajectory_uint8 else "float32", resume_from))
+
+
+# Finish any background writes of the attached recorders, closing every one
+# of them before raising the first write error
+def close_observers(state):
+    errors = []
+    for observer in state.observers:
+        if hasattr(observer, "close"):
+            try:
+                observer.close()
+            except Exception as error:
+                errors.append(error)
+    if errors:
+        raise errors[0]
+
+
+# Parse "key=value" agent parameter overrides
+def parse_param(text):
+    key, _, value = text.partition("=")
+    if not value:
+        raise argparse.ArgumentTypeError(f"Expected key=value, got {text}")
+    return key, float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a simulation without the pygame display.')
+    parser.add_argument('--config', help='JSON file overriding the defaults in config.py')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--grid-size', type=int)
+    parser.add_argument('--num-agents', type=int)
+    parser.add_argument('--max-iters', type=int)
+    parser.add_argument('--max-agents', type=int)
+    parser.add_argument('--c-max', type=float)
+    parser.add_argument('--d-c', type=float)
+    parser.add_argument('--time-step', type=float)
+    parser.add_argument('--engine', choices=['object', 'vector', 'jit'])
+    parser.add_argument('--diffusion', choices=['convolve', 'stencil', 'substep', 'implicit', 'jit'])
+    parser.add_argument('--dormancy', type=float,
+                        help='Nutrient level below which imotile agents go dormant and are skipped')
+    parser.add_argument('--precision', choices=['float64', 'float32'],
+                        help='Nutrient grid dtype (float32 halves its memory)')
+    parser.add_argument('--workers', type=int,
+                        help='Split the dish over this many worker processes (no checkpoints)')
+    parser.add_argument('--param', type=parse_param, action='append', default=[],
+                        help='Agent parameter override, e.g. --param r_max=0.05 (repeatable)')
+    parser.add_argument('--out', help='Output folder (default figures/DATA_<timestamp>)')
+    parser.add_argument('--snapshot-interval', type=int, default=0,
+                        help='Save agent data every N iterations (0 = only at the end)')
+    parser.add_argument('--data-format', choices=['npz', 'json'], default='npz',
+                        help='Agent data format: columnar .npz, or the legacy per-agent .json')
+    parser.add_argument('--log-interval', type=int, default=1000)
+    parser.add_argument('--checkpoint-interval', type=int, default=0,
+                        help='Write checkpoint.npz every N iterations (0 = never)')
+    parser.add_argument('--frame-interval', type=int, default=0,
+                        help='Save a frame_<iteration>.png image every N iterations (0 = never)')
+    parser.add_argument('--movie', nargs='+', metavar='FILE',
+                        help='With --frame-interval, stream frames into these .gif/.mp4/.webm files '
+                        'in the output folder instead of saving PNGs')
+    parser.add_argument('--metrics-interval', type=int, default=0,
+                        help='Record colony metrics to metrics.csv every N iterations (0 = never)')
+    parser.add_argument('--trajectory-interval', type=int, default=0,
+                        help='Record the nutrient grid and agents every N iterations to trajectory/ (0 = never)')
+    parser.add_argument('--trajectory-downsample', type=int, default=1,
+                        help='Store trajectory nutrient grids averaged over NxN blocks')
+    parser.add_argument('--trajectory-uint8', action='store_true',
+                        help='Store trajectory nutrient grids as 8-bit fractions of c_max')
+    parser.add_argument('--profile', type=int, default=0, metavar='N',
+                        help='Print and save (profile.csv) the time spent in each phase every N iterations')
+    parser.add_argument('--profile-allocations', action='store_true',
+                        help='With --profile, also track memory allocated by Python (slower)')
+    parser.add_argument('--resume', help='Continue from a checkpoint.npz (other options except '
+                        '--max-iters/--max-agents/--out are taken from the checkpoint)')
+    args = parser.parse_args(argv)
+    if args.movie and not args.frame_interval:
+        parser.error("--movie needs --frame-interval")
+
+    if args.resume:
+        state = load_checkpoint(args.resume)
+        state.max_iters = args.max_iters or state.max_iters
+        out_dir = args.out or os.path.dirname(args.resume) or "."
+        # max_agents is not part of the simulation state, take it from the run's config
+        saved_config = f"{os.path.dirname(args.resume) or '.'}/config.json"
+        max_agents = args.max_agents or (load_config(saved_config)["max_agents"] if os.path.exists(saved_config)
+                                         else DEFAULTS["max_agents"])
+        add_observers(state, args, out_dir, resume_from=state.iteration)
+        print(f"Resuming from iteration {state.iteration} with {state.agent_count()} agents")
+        try:
+            run(state, max_agents, out_dir, args.snapshot_interval, args.log_interval, args.checkpoint_interval,
+                args.frame_interval, args.movie, args.data_format)
+        finally:
+            close_observers(state)
+        return
+
+    overrides = {key: getattr(args, key) for key in
+                 ("seed", "grid_size", "num_agents", "max_iters", "max_agents", "c_max", "d_c",
+                  "time_step", "engine", "diffusion", "dormancy", "workers", "precision")
+                 if getattr(args, key) is not None}
+    if args.param:
+        overrides["agent_params"] = dict(args.param)
+    config = load_config(args.config, overrides)
+    if config["workers"] > 1 and args.checkpoint_interval:
+        parser.error("--checkpoint-interval is not supported with more than one worker")
+
+    out_dir = args.out or f'figures/DATA_{datetime.datetime.now().strftime("%Y%m%d-%H%M%S")}'
+    os.makedirs(out_dir, exist_ok=True)
+    with open(f"{out_dir}/config.json", 'w') as f:
+        json.dump(config, f, indent=4)
+
+    state = build_state(config)
+    add_observers(state, args, out_dir)
+    try:
+        run(state, config["max_agents"], out_dir, args.snapshot_interval, args.log_interval,
+            args.checkpoint_interval, args.frame_interval, args.movie, args.data_format)
+    finally:
+        close_observers(state)
+        if hasattr(state, "close"):
+            state.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+from population import Population
+
+# Numba is optional: without it the 'jit' engine and diffusion backend fall
+# back to the NumPy code of the 'vector' engine and 'stencil' backend
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    eat_move_kernel = diffuse_kernel = None
+
+PI = math.pi
+
+if njit is not None:
+    # Eat and move every agent in one pass. Demand is summed per cell first so
+    # agents sharing a cell split what is there (as in Petri.consume_nutrients);
+    # `grid`, `demand` and `share` are flattened grid-sized arrays, the last
+    # two scratch space that is all zero on entry and on exit. Agents whose
+    # run ended are flagged in `turning` and the caller gives them new
+    # headings, so random numbers are drawn in the same order as the vector
+    # engine. Returns the bounding box of the cells eaten from.
+    @njit(cache=True, parallel=True)
+    def eat_move_kernel(x, y, mass, theta, time_to_change, imotile, turning, want, cell, grid, demand, share,
+                        size, r_max, K_m, m_min, m_max, p, density, F_d, drag, delta_H):
+        n = len(x)
+        limit = size - 1
+        x_min, x_max, y_min, y_max = limit, 0, limit, 0
+        for i in range(n):
+            ix, iy = int(np.rint(x[i])), int(np.rint(y[i]))
+            c = ix * size + iy
+            cell[i] = c
+            level = grid[c]
+            want[i] = (r_max * level) / (K_m + level)
+            demand[c] += want[i]
+            x_min, x_max = min(x_min, ix), max(x_max, ix)
+            y_min, y_max = min(y_min, iy), max(y_max, iy)
+
+        # Hand out each cell once, in proportion to its agents' demand.
+        # Cells nobody asked anything of keep a share of 1.
+        for i in range(n):
+            share[cell[i]] = 1.0
+        for i in range(n):
+            c = cell[i]
+            total = demand[c]
+            if total > 0:
+                available = max(grid[c], 0.0)
+                supplied = min(total, available)
+                grid[c] = available - supplied
+                share[c] = supplied / total
+                demand[c] = 0.0
+
+        for i in prange(n):
+            m = mass[i] + p * (want[i] * share[cell[i]]) * (mass[i] / density)
+            imotile[i] = m_min > m
+            turning[i] = False
+            if not imotile[i] and m_min <= m < m_max:
+                if time_to_change[i] > 0:
+                    radius = math.sqrt((m / density) / PI)
+                    velocity = F_d / (drag * radius)
+                    x[i] = min(max(x[i] + velocity * math.cos(theta[i]), 0.0), limit)
+                    y[i] = min(max(y[i] + velocity * math.sin(theta[i]), 0.0), limit)
+                    m -= abs(F_d) * velocity / delta_H
+                    time_to_change[i] -= 1
+                else:
+                    turning[i] = True
+            mass[i] = m
+
+        for i in range(n):
+            share[cell[i]] = 0.0
+        return x_min, x_max, y_min, y_max
+
+    # One explicit diffusion step of rows r0:r1, columns c0:c1 with
+    # edge-replicating borders, in place: new values go to `out` and are
+    # copied back once the whole window has been computed
+    @njit(cache=True, parallel=True)
+    def diffuse_kernel(grid, out, r0, r1, c0, c1, coefficient):
+        rows, cols = grid.shape
+        for r in prange(r0, r1):
+            up, down = max(r - 1, 0), min(r + 1, rows - 1)
+            for c in range(c0, c1):
+                left, right = max(c - 1, 0), min(c + 1, cols - 1)
+                centre = grid[r, c]
+                out[r, c] = centre + coefficient * (grid[up, c] + grid[down, c] + grid[r, left]
+                                                    + grid[r, right] - 4 * centre)
+        for r in prange(r0, r1):
+            for c in range(c0, c1):
+                grid[r, c] = out[r, c]
+
+
+# Population stepped by the compiled kernels: eat and move fused into one
+# pass over the agents, replicate as in Population. Without numba it is a
+# plain Population.
+class JitPopulation(Population):
+    def __init__(self, petri, params, capacity=1024):
+        super().__init__(petri, params, capacity)
+        if njit is None:
+            print("[WARNING] numba is not installed, the jit engine runs the vector engine's NumPy code")
+            return
+        self._demand = np.zeros(petri.nutrient_grid.size)
+        self._share = np.zeros(petri.nutrient_grid.size)
+        self._scratch_size = 0
+
+    def _scratch(self, n):
+        if n > self._scratch_size:
+            self._scratch_size = max(n, 2 * self._scratch_size)
+            self._want = np.empty(self._scratch_size)
+            self._cell = np.empty(self._scratch_size, dtype=np.int64)
+            self._turning = np.empty(self._scratch_size, dtype=np.bool_)
+        return self._want[:n], self._cell[:n], self._turning[:n]
+
+    def eat_and_move(self):
+        self.wake()
+        n = self.n
+        if n == 0:
+            return
+        want, cell, turning = self._scratch(n)
+        petri = self.petri
+        bounds = eat_move_kernel(self.x[:n], self.y[:n], self.mass[:n], self.theta[:n], self.time_to_change[:n],
+                                 self.imotile[:n], turning, want, cell, petri.nutrient_grid.reshape(-1),
+                                 self._demand, self._share, petri.grid_size, self.r_max, self.K_m, self.m_min, self.m_max,
+                                 self.p, self.density, self.F_d, self.drag, self.delta_H)
+        if petri.active_region:
+            x_min, x_max, y_min, y_max = bounds
+            petri.mark_dirty(x_min, x_max + 1, y_min, y_max + 1)
+        turned = np.flatnonzero(turning)
+        if len(turned):
+            self.turn(turned)
+        # Agents that just went dormant are imotile, so they did not move either
+        self.freeze()
+
+    # Advance every agent by one simulation step
+    def step(self):
+        if njit is None or self.petri.index is not None:
+            # The spatial index is updated by Population.move
+            super().step()
+            return
+        self.eat_and_move()
+        self.replicate()
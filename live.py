@@ -0,0 +1,271 @@
+import multiprocessing as mp
+import pickle
+import queue
+import time
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from config import build_state
+from snapshots import FrameWriter
+from render import render_indices
+
+# Header of the shared frame, int64 slots before the palette index image
+HEADER = ("sequence", "iteration", "agents", "done")
+
+
+# Shared memory for one published frame: the header followed by the
+# render.render_indices image of the dish
+def _frame_views(buffer, grid_size):
+    header = np.ndarray((len(HEADER),), dtype=np.int64, buffer=buffer)
+    indices = np.ndarray((grid_size, grid_size), dtype=np.uint8, buffer=buffer, offset=header.nbytes)
+    return header, indices
+
+
+# Write the current frame. The sequence number is odd while the frame is being
+# written, so a reader that sees it odd, or changed over its copy, tries again.
+def _publish(state, header, indices, done):
+    header[0] += 1
+    indices[:] = render_indices(state.petri.nutrient_grid, state.petri.C_max, *_positions(state))
+    header[1] = state.iteration
+    header[2] = state.agent_count()
+    header[3] = done
+    header[0] += 1
+
+
+def _positions(state):
+    x, y, _, imotile = state.agent_arrays()
+    return x, y, imotile
+
+
+# The simulation process: steps the state as fast as it can, publishes a frame
+# at most every `publish_period` seconds and handles the viewer's commands
+# between steps. Replies are ("ok", value), or ("error", exception) once the
+# run has failed, after which the process exits.
+def _serve(config, max_agents, shm_name, commands, replies, publish_period):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    header, indices = _frame_views(shm.buf, config["grid_size"])
+    try:
+        _run(config, max_agents, header, indices, commands, replies, publish_period)
+    except Exception as error:
+        traceback.print_exc()
+        replies.put(("error", _portable(error)))
+    finally:
+        del header, indices
+        shm.close()
+
+
+# The exception itself if it can be sent to the viewer, otherwise a
+# RuntimeError carrying its traceback
+def _portable(error):
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError("Simulation process failed:\n" + "".join(traceback.format_exception(error)))
+
+
+def _run(config, max_agents, header, indices, commands, replies, publish_period):
+    state = build_state(config)
+    frame_writer = None
+    frame_interval = 0
+    published = 0.0
+    done = False
+    try:
+        while True:
+            stop = False
+            while not commands.empty() or state.paused or done:
+                try:
+                    # Idle (paused or finished) runs wait here for the next command
+                    command, arguments = commands.get(timeout=publish_period) if state.paused or done \
+                        else commands.get_nowait()
+                except queue.Empty:
+                    break
+                if command == "stop":
+                    stop = True
+                    break
+                if command == "pause":
+                    state.paused = arguments
+                elif command == "set_params":
+                    state.set_params(*arguments)
+                elif command == "reset":
+                    state.reset()
+                elif command == "save_data":
+                    state.save_data(arguments)
+                    replies.put(("ok", arguments))
+                elif command == "frames":
+                    if frame_writer is not None:
+                        frame_writer.close()
+                    folder, frame_interval = arguments
+                    frame_writer = FrameWriter(maxsize=8, policy="drop_oldest") if folder else None
+                    replies.put(("ok", folder))
+                done = state.iteration >= state.max_iters or state.agent_count() >= max_agents
+                _publish(state, header, indices, done)
+                published = time.perf_counter()
+            if stop:
+                break
+
+            done = state.iteration >= state.max_iters or state.agent_count() >= max_agents
+            if not state.paused and not done:
+                state.update()
+                if frame_writer is not None and state.iteration % frame_interval == 0:
+                    frame_writer.submit(state, f"{folder}/frame_{state.iteration}.png")
+            now = time.perf_counter()
+            if now - published >= publish_period or done:
+                _publish(state, header, indices, done)
+                published = now
+    finally:
+        if frame_writer is not None:
+            frame_writer.close()
+        if hasattr(state, "close"):
+            state.close()
+
+
+# Runs a simulation built from `config` (see config.build_state) in its own
+# process at full speed, so a viewer no longer throttles it. The process
+# publishes the rendered dish through shared memory; this object reads the
+# latest frame and steers the run over a command queue, standing in for the
+# SimulationState as far as the pygame app is concerned. The run stops by
+# itself at max_iters or `max_agents` agents. Call close() when done. If the
+# simulation process fails, the next call raises its exception.
+class LiveSimulation:
+    def __init__(self, config, max_agents, publish_fps=60):
+        self.grid_size = config["grid_size"]
+        self.agent_params = dict(config["agent_params"])
+        self.c_max = config["c_max"]
+        self.d_c = config["d_c"]
+        self.time_step = config["time_step"]
+        self.seed = config["seed"]
+        self.num_agents = config["num_agents"]
+        self.max_iters = config["max_iters"]
+        self.paused = True
+
+        self.shm = shared_memory.SharedMemory(create=True, size=len(HEADER) * 8 + self.grid_size ** 2)
+        self.header, self.indices = _frame_views(self.shm.buf, self.grid_size)
+        self.header[:] = 0
+        self.indices[:] = 0
+        self._frame = np.zeros((self.grid_size, self.grid_size), dtype=np.uint8)
+        self.frame_number = self._iteration = self._agents = 0
+        self._done = False
+        self.commands = mp.Queue()
+        self.replies = mp.Queue()
+        self.process = mp.Process(target=_serve, daemon=True,
+                                  args=(config, max_agents, self.shm.name, self.commands, self.replies,
+                                        1 / publish_fps))
+        self.process.start()
+        # Wait for the first frame
+        while self.header[0] == 0 and self.process.is_alive():
+            time.sleep(0.01)
+        try:
+            self.refresh()
+        except Exception:
+            self.close()
+            raise
+
+    # Raise the simulation process' exception if it has exited
+    def _check_alive(self):
+        if not self.process.is_alive():
+            raise self._failure()
+
+    def _failure(self):
+        try:
+            status, value = self.replies.get(timeout=1)
+            if status == "error":
+                return value
+        except queue.Empty:
+            pass
+        return RuntimeError(f"Simulation process exited (exit code {self.process.exitcode})")
+
+    # Next reply of the simulation process, raising its exception if it failed
+    # or exited instead of replying
+    def _reply(self):
+        while True:
+            try:
+                status, value = self.replies.get(timeout=0.1)
+            except queue.Empty:
+                self._check_alive()
+                continue
+            if status == "error":
+                raise value
+            return value
+
+    # Copy the latest complete frame out of shared memory
+    def refresh(self):
+        self._check_alive()
+        header = self.header
+        while True:
+            sequence = int(header[0])
+            if sequence % 2:
+                # A process that died mid-write never finishes the frame
+                self._check_alive()
+                continue
+            self._frame[:] = self.indices
+            iteration, agents, done = int(header[1]), int(header[2]), bool(header[3])
+            if int(header[0]) == sequence:
+                break
+        self.frame_number = sequence // 2
+        self._iteration, self._agents, self._done = iteration, agents, done
+
+    # Iteration and agent count of the latest frame (frame_number counts the
+    # frames published so far)
+    @property
+    def iteration(self):
+        return self._iteration
+
+    def agent_count(self):
+        return self._agents
+
+    # Whether the run has reached max_iters or max_agents
+    @property
+    def done(self):
+        return self._done
+
+    # Palette indices of the latest frame (see render.render_indices)
+    def frame_indices(self):
+        return self._frame
+
+    # The simulation steps by itself; the viewer only picks up the new frame
+    def update(self):
+        self.refresh()
+
+    def toggle_pause(self):
+        self.paused = not self.paused
+        self.commands.put(("pause", self.paused))
+
+    # Same as SimulationState.set_params, applied by the simulation process
+    def set_params(self, key, value, restart=True):
+        if key in self.agent_params:
+            self.agent_params[key] = value
+        elif key in ("d_c", "time_step", "num_agents", "c_max", "seed"):
+            setattr(self, key, value)
+        else:
+            print(f"Invalid parameter key: {key}")
+            return
+        self.commands.put(("set_params", (key, value, restart)))
+        if restart or key in ("num_agents", "c_max", "seed"):
+            self.paused = True
+
+    def reset(self):
+        self.commands.put(("reset", None))
+        self.paused = True
+
+    # Save the agents (see SimulationState.save_data), waiting until written
+    def save_data(self, filename):
+        self.commands.put(("save_data", filename))
+        self._reply()
+
+    # Have the simulation process write a PNG into `folder` every `interval`
+    # iterations (see snapshots.FrameWriter), or stop with folder=None
+    def set_frames(self, folder, interval=1000):
+        self.commands.put(("frames", (folder, interval)))
+        self._reply()
+
+    # Stop the simulation process and free the shared frame
+    def close(self):
+        if self.shm is None:
+            return
+        self.commands.put(("stop", None))
+        self.process.join()
+        del self.header, self.indices
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
@@ -8,6 +8,11 @@ import datetime
 from agent import Agent
 from petri import Petri
 from simstate import SimulationState
+from config import DEFAULTS, dimensionless_groups, load_config
+from render import PALETTE, render_frame
+from live import LiveSimulation
+from snapshots import FrameWriter
+from profiler import Profiler
 
 import pygame_widgets
 from pygame_widgets.button import Button
@@ -19,9 +24,8 @@ from pygame_widgets.toggle import Toggle
 PI = math.pi
 folder = f'DATA_{datetime.datetime.now().strftime("%Y%m%d-%H%M%S")}'
 
-# Generate Seed for replicable results
+# Generate Seed for replicable results (each simulation seeds its own random stream)
 SEED = npr.randint(0,100)
-npr.seed(SEED) # only need to do it here (not for every agent move)
 
 # Global dicts to hold widgets
 buttons ={}
@@ -58,7 +62,7 @@ def save_frame(screen, filename):
     print(f"Saved frame to {filename}")
     
 
-# Save the simulation data to json if 'save data' button pressed
+# Save the simulation data if 'save data' button pressed
 def save_data(state, filename):
     if not os.path.exists(f"figures/{folder}"):
         os.makedirs(f"figures/{folder}")
@@ -91,6 +95,18 @@ def reset(state):
     if not os.path.exists(f"figures/{folder}"):
         os.makedirs(f"figures/{folder}")
     set_button_text(buttons['play_pause'], "Play" if state.paused else "Pause") # reset changes state to paused so update button
+
+
+# Apply slider changes to the running simulation (parameters that need a
+# fresh dish, seed, num_agents and c_max, wait for reset)
+def steer(state):
+    for key in sliders:
+        value = sliders[key].getValue()
+        if key in ("seed", "num_agents", "c_max"):
+            continue
+        current = state.agent_params[key] if key in state.agent_params else getattr(state, key)
+        if value != current:
+            state.set_params(key, value, restart=False)
    
 
 # Initialise Widgets
@@ -101,7 +117,7 @@ def init_widgets(screen,state):
                                  inactiveColour=(21,122,110), hoverColour=(15, 87, 80), radius=12, textColour=(225,228,221), pressedColour=(9,52,48))
     buttons['restart']=Button(screen, offset+100, 10, 80, 30, text="Reset", onClick=lambda:reset(state), 
                               inactiveColour=(21,122,110), hoverColour=(15, 87, 80), radius=12, textColour=(225,228,221), pressedColour=(9,52,48))
-    buttons['save_data']=Button(screen, offset+10, 50, 80, 30, text="Save Data", onClick=lambda:save_data(state, f"data_{state.iteration}.csv"), 
+    buttons['save_data']=Button(screen, offset+10, 50, 80, 30, text="Save Data", onClick=lambda:save_data(state, f"data_{state.iteration}.npz"), 
                                 inactiveColour=(21,122,110), hoverColour=(15, 87, 80), radius=12, textColour=(225,228,221), pressedColour=(9,52,48))
     buttons['save_pic']=Button(screen, offset+100, 50, 80, 30, text="Save Img", onClick=lambda:save_frame(screen, f"img_{state.iteration}"), 
                                inactiveColour=(21,122,110), hoverColour=(15, 87, 80), radius=12, textColour=(225,228,221), pressedColour=(9,52,48))
@@ -210,26 +226,22 @@ def init_widgets(screen,state):
     
 # Draw the bacteria/nutrient grid on the screen
 def draw_grid(screen, state):
-    # Draw nutrient map
-    for x in range(state.grid_size):
-        for y in range(state.grid_size):
-            percent_diff = 1 - state.petri.nutrient_grid[x, y]/state.petri.C_max
-            pygame.draw.circle(screen, (79+int(146*percent_diff),53+int(175*percent_diff),155+int(66*(percent_diff))), (x * 2, y * 2), 1)
-
-    # Draw agents
-    for agent in state.petri.agents:
-        if agent.imotile:
-            colour = (0,0,0)
-        else:
-            colour = (229, 89, 52)
-        pygame.draw.circle(screen, colour, (int(agent.x * 2), int(agent.y * 2)), 1)
+    # Draw nutrient map and agents as one image, scaled 2x in a single blit
+    if isinstance(state, LiveSimulation):
+        # Already rendered by the simulation process
+        frame = PALETTE[state.frame_indices()]
+    else:
+        x, y, _, imotile = state.agent_arrays()
+        frame = render_frame(state.petri.nutrient_grid, state.petri.C_max, x, y, imotile)
+    surface = pygame.surfarray.make_surface(frame)
+    screen.blit(pygame.transform.scale(surface, (state.grid_size * 2, state.grid_size * 2)), (0, 0))
 
     # Draw text labels
     midpoint = state.grid_size
     font = pygame.font.SysFont("Arial", 15)
     iter_label = font.render(f"Iterations: {state.iteration}", True, (255, 255, 255))
     screen.blit(iter_label, (midpoint +100, 10))
-    agent_label = font.render(f"Agents: {len(state.petri.agents)}", True, (255, 255, 255))
+    agent_label = font.render(f"Agents: {state.agent_count()}", True, (255, 255, 255))
     screen.blit(agent_label, (midpoint - 50, 10))
     seed_label = font.render(f"Seed: {state.seed}", True, (255, 255, 255))
     screen.blit(seed_label, (midpoint-220, 10))
@@ -258,24 +270,8 @@ def draw_ui(screen, state):
             slider_outputs[key].setText(f"{sliders[key].getValue()}")
 
     # Calculate ABCDE values based on sliders
-    m_min = sliders['m_min'].getValue()
-    density = sliders['density'].getValue()
-    F_d = sliders['F_d'].getValue()
-    mu = sliders['mu'].getValue()
-    r_max = sliders['r_max'].getValue()
-    c_max = sliders['c_max'].getValue()
-    K_m = sliders['K_m'].getValue()
-    p = sliders['p'].getValue()
-    delta_H = sliders['delta_H'].getValue()
-    d_c = sliders['d_c'].getValue()
-    min_r = math.sqrt((m_min/density)/math.pi)
-    v_max = (F_d/(4*math.pi*mu*min_r))
-    vals = {}
-    vals['A'] = K_m/c_max
-    vals['B'] = (r_max*min_r)/(c_max*v_max)
-    vals['C'] = (min_r*p*r_max)/(v_max*density)
-    vals['D'] = (d_c)/(min_r*v_max)
-    vals['E'] = (F_d*min_r)/(m_min*delta_H)
+    values = {key: sliders[key].getValue() for key in sliders}
+    vals = dimensionless_groups(values, values['c_max'], values['d_c'])
     # Display ABCDE values
     i = 0
     label = font.render(f'Dimensionless Params:', True, (30,21,60))
@@ -295,46 +291,43 @@ def draw_ui(screen, state):
 def main():
 
  
-    # Nutrient Grid Parameters:
-    GRID_SIZE = 512  # Square grid dimensions
-    TIME_STEP = 1 # Stepwise diffusion rate per loop iteration
-    C_MAX = 1.0 # Max nutrient val oon a given square
-    D_C = 0.05 # rate of diffusion
-
-    AGENT_PARAMS = {
-        "r_max": 0.0498,
-        "K_m": 0.25,
-        "m_min": 1,
-        "delta_H": 10,
-        "F_d": 0.5,
-        "mu": 0.8,
-        "p": 0.02,
-        "density": 0.08,
-    }
+    # Nutrient Grid Parameters (defaults live in config.py):
+    GRID_SIZE = DEFAULTS["grid_size"]  # Square grid dimensions
+    TIME_STEP = DEFAULTS["time_step"] # Stepwise diffusion rate per loop iteration
+    C_MAX = DEFAULTS["c_max"] # Max nutrient val oon a given square
+    D_C = DEFAULTS["d_c"] # rate of diffusion
+
+    AGENT_PARAMS = dict(DEFAULTS["agent_params"])
     
     # Paper values
-    min_r = math.sqrt((AGENT_PARAMS["m_min"]/AGENT_PARAMS["density"])/math.pi)
-    v_max = (AGENT_PARAMS["F_d"]/(4*math.pi*AGENT_PARAMS["mu"]*min_r))
-    print(f'A: {AGENT_PARAMS["K_m"]/C_MAX}')
-    print(f'B: {(AGENT_PARAMS["r_max"]*min_r)/(C_MAX*v_max)}')
-    print(f'C: {(min_r*AGENT_PARAMS["p"]*AGENT_PARAMS["r_max"])/(v_max*AGENT_PARAMS["density"])}')
-    print(f'D: {(D_C)/(min_r*v_max)}')
-    print(f'E: {(AGENT_PARAMS["F_d"]*min_r)/(AGENT_PARAMS["m_min"]*AGENT_PARAMS["delta_H"])}')
+    for key, value in dimensionless_groups(AGENT_PARAMS, C_MAX, D_C).items():
+        print(f'{key}: {value}')
     
     # Simulation Parameters:
 
-    max_iters = 300000     # Number of loop iterations for simulation
-    max_agents = 30000
-    num_agents = 50   # Initial cell count
+    max_iters = DEFAULTS["max_iters"]     # Number of loop iterations for simulation
+    max_agents = DEFAULTS["max_agents"]
+    num_agents = DEFAULTS["num_agents"]   # Initial cell count
     mode = 'gif'    # 'vis' for visualisation, 'gif' same but saves images.
+    engine = DEFAULTS["engine"]   # 'object' for per-agent updates, 'vector' for batched array updates, 'jit' for compiled kernels (numba)
+    diffusion = DEFAULTS["diffusion"]   # 'convolve', 'stencil', 'substep', 'implicit' or 'jit'
+    active_region = DEFAULTS["active_region"]    # only diffuse the part of the dish the colony has disturbed
+    profile_interval = 0    # print and save per-phase timings every N iterations (0 = off)
+    live = True    # run the simulation in its own process at full speed, the window only shows its latest frame (see live.py)
 
     # Simulation state (holds all simulation data + petri dish + agents)
-    sim = SimulationState(GRID_SIZE, AGENT_PARAMS, C_MAX, D_C, TIME_STEP, SEED, num_agents, max_iters)
+    if live:
+        sim = LiveSimulation(load_config(overrides={"seed": SEED, "num_agents": num_agents, "max_iters": max_iters, "engine": engine,
+                                                    "diffusion": diffusion, "active_region": active_region}), max_agents)
+    else:
+        sim = SimulationState(GRID_SIZE, AGENT_PARAMS, C_MAX, D_C, TIME_STEP, SEED, num_agents, max_iters, engine=engine, diffusion=diffusion, active_region=active_region)
     sim.paused = True
 
     # Create output directory for GIFs
     if not os.path.exists(f"figures/{folder}"):
         os.makedirs(f"figures/{folder}")
+    if profile_interval and not live:
+        sim.profiler = Profiler(profile_interval, f"figures/{folder}/profile.csv")
 
     # Start simulation
     pygame.init()
@@ -345,6 +338,10 @@ def main():
 
     draw_interval = 200
     pic_interval = 1000
+    # Gif-mode frames are rendered and saved on a background thread (by the
+    # simulation process when live)
+    frame_writer = FrameWriter(maxsize=8, policy="drop_oldest")
+    frames_to = None
     
     # First screen
     screen.fill("black")
@@ -361,7 +358,7 @@ def main():
     
     # Continue while there are iterations left and the simulation is running
 
-    while sim.iteration < sim.max_iters and len(sim.petri.agents) < max_agents and running:
+    while sim.iteration < sim.max_iters and sim.agent_count() < max_agents and running:
         # Check for events (quit, mouse click)
         events = pygame.event.get()
         pygame_widgets.update(events)
@@ -371,6 +368,7 @@ def main():
                 break
             # Redraw if mouse is clicked
             if event.type == pygame.MOUSEBUTTONUP:
+                steer(sim)
                 draw_grid(screen, sim)
                 draw_ui(screen, sim)
                 pygame.display.update(grid_rect)
@@ -381,23 +379,40 @@ def main():
         pygame.display.update(panel_rect)
         
 
+        if live:
+            # Frames go to the current folder, which changes on reset
+            if (mode, folder) != frames_to:
+                sim.set_frames(f"figures/{folder}" if mode == 'gif' else None, pic_interval)
+                frames_to = (mode, folder)
+            # The simulation steps by itself, show its latest frame
+            shown = sim.frame_number
+            sim.update()
+            if sim.frame_number != shown:
+                draw_grid(screen, sim)
+                pygame.display.update(grid_rect)
+
         # Update if simulation is not paused
-        if not sim.paused:
+        elif not sim.paused:
             sim.update() # update agents + grid
             # Update pygame display every 100 iterations
             if sim.iteration % (draw_interval)==0:
-                draw_grid(screen, sim)
-                pygame.display.update(grid_rect)
+                with sim.phase("render"):
+                    draw_grid(screen, sim)
+                    pygame.display.update(grid_rect)
 
                 # Save image every 500 iterations
                 if mode == 'gif' and sim.iteration % (pic_interval)==0:
-                    pygame.image.save(screen, f"figures/{folder}/frame_{sim.iteration}.png")
+                    with sim.phase("frames"):
+                        frame_writer.submit(sim, f"figures/{folder}/frame_{sim.iteration}.png")
                     
         clock.tick(60)
 
     
-    save_data(sim, f"data_{sim.iteration}.json")
+    frame_writer.close()
+    save_data(sim, f"data_{sim.iteration}.npz")
     save_frame(screen, f"img_{sim.iteration}.png") 
+    if live:
+        sim.close()
 
     # Keep window open until manually closed
     while running:
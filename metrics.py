@@ -0,0 +1,66 @@
+import csv
+import os
+import time
+import numpy as np
+from fractal import BOX_SIZES, occupancy_grid, box_count_dimension, lacunarity_exponent
+
+METRIC_FIELDS = ["iteration", "agents", "imotile_fraction", "radius", "radius_of_gyration",
+                 "box_dimension", "box_r2", "lacunarity_exponent", "wall_time"]
+
+
+# Morphology metrics of the colony in its current state
+def colony_metrics(state, box_sizes=BOX_SIZES):
+    x, y, _, imotile = state.agent_arrays()
+    row = {"iteration": state.iteration, "agents": len(x)}
+    if len(x) == 0:
+        return row
+
+    # Radii around the colony's centre of mass
+    distance = np.hypot(x - x.mean(), y - y.mean())
+    grid = occupancy_grid(x, y, state.grid_size)
+    fit = box_count_dimension(grid, box_sizes)
+    row.update({
+        "imotile_fraction": float(np.mean(imotile)),
+        "radius": float(distance.max()),
+        "radius_of_gyration": float(np.sqrt(np.mean(distance ** 2))),
+        "box_dimension": fit["dimension"],
+        "box_r2": fit["r2"],
+        "lacunarity_exponent": float(lacunarity_exponent(grid, box_sizes)),
+    })
+    return row
+
+
+# Samples colony_metrics every `interval` iterations while a simulation runs
+# (add it to SimulationState.observers) and appends each sample to a CSV file
+# if one is given, so the time series can be followed during the run. The
+# file is started afresh, unless `resume_from` is given: then the rows up to
+# that iteration are kept (later ones, e.g. written after the last checkpoint
+# of a crashed run, are dropped) and recording continues after them.
+class MetricsRecorder:
+    def __init__(self, interval, filename=None, box_sizes=BOX_SIZES, resume_from=None):
+        self.interval = interval
+        self.filename = filename
+        self.box_sizes = box_sizes
+        self.rows = []
+        kept = []
+        if filename and resume_from is not None and os.path.exists(filename):
+            with open(filename, 'r', newline='') as f:
+                kept = [row for row in csv.DictReader(f) if int(row["iteration"]) <= resume_from]
+        # Wall time carries on from the last kept row
+        elapsed = float(kept[-1]["wall_time"]) if kept and kept[-1]["wall_time"] else 0.0
+        self.start = time.perf_counter() - elapsed
+        if filename:
+            with open(filename, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=METRIC_FIELDS)
+                writer.writeheader()
+                writer.writerows(kept)
+
+    def observe(self, state):
+        if state.iteration % self.interval:
+            return
+        row = colony_metrics(state, self.box_sizes)
+        row["wall_time"] = time.perf_counter() - self.start
+        self.rows.append(row)
+        if self.filename:
+            with open(self.filename, 'a', newline='') as f:
+                csv.DictWriter(f, fieldnames=METRIC_FIELDS).writerow(row)
@@ -1,31 +1,243 @@
 import numpy as np
 from scipy.ndimage import convolve
+from scipy.fft import dctn, idctn
+from spatial import CellList
+from rng import RandomStream
+from kernels import diffuse_kernel
+
+DIFFUSION_BACKENDS = ("convolve", "stencil", "substep", "implicit", "jit")
+# Nutrient grid dtypes
+PRECISIONS = ("float64", "float32")
+
+
+# 5-point Laplacian with edge-replicating ("nearest") borders, written into a
+# preallocated `out` array using slices only. Works on the last two axes, so
+# a stack of grids is done in one call.
+def stencil_laplacian(grid, out):
+    np.multiply(grid, -4, out=out)
+    out[..., 1:, :] += grid[..., :-1, :]
+    out[..., 0, :] += grid[..., 0, :]
+    out[..., :-1, :] += grid[..., 1:, :]
+    out[..., -1, :] += grid[..., -1, :]
+    out[..., :, 1:] += grid[..., :, :-1]
+    out[..., :, 0] += grid[..., :, 0]
+    out[..., :, :-1] += grid[..., :, 1:]
+    out[..., :, -1] += grid[..., :, -1]
+    return out
+
 
 class Petri:
-    def __init__(self, grid_size, C_max, D_c, time_step):
+    def __init__(self, grid_size, C_max, D_c, time_step, diffusion="convolve", substeps=4, active_region=False, rng=None, dtype="float64"):
+        if diffusion not in DIFFUSION_BACKENDS:
+            raise ValueError(f"Unknown diffusion backend: {diffusion}")
         self.grid_size = grid_size
         self.C_max = C_max
         self.D_c = D_c
         self.time_step = time_step
         self.agents = []
+        # Random stream shared by every agent in this dish
+        self.rng = rng if rng is not None else RandomStream()
 
-        self.nutrient_grid = np.full((grid_size, grid_size), C_max, dtype=float)
+        self.nutrient_grid = np.full((grid_size, grid_size), C_max, dtype=dtype)
 
         self.laplacian_kernel = np.array([[0, 1, 0],
                                           [1, -4, 1],
                                           [0, 1, 0]])
-        
+
+        # 'convolve' is the reference, 'stencil' is the same update in place,
+        # 'substep' splits each step into explicit substeps and 'implicit' is
+        # backward Euler solved with a DCT (stable for any time_step). 'jit' is
+        # the stencil update as one compiled in-place loop (needs numba).
+        # 'substep' is an accuracy/stability option, not a speedup: it runs
+        # `substeps` full stencil passes of time_step / substeps per step, so it
+        # costs about that many times a 'stencil' step, and its results differ
+        # from 'convolve' by the smaller time discretisation error.
+        if diffusion == "jit" and diffuse_kernel is None:
+            print("[WARNING] numba is not installed, jit diffusion runs the stencil backend")
+        self.diffusion = diffusion
+        self.substeps = substeps
+        self._laplacian_buffer = np.empty_like(self.nutrient_grid)
+        self._implicit_factor = None
+        self._implicit_key = None
+
+        # With active_region on, explicit backends only diffuse inside a window
+        # around every cell that has left the C_max plateau. The window (row and
+        # column bounds, end exclusive) grows with the diffusion front and ends
+        # up as the whole grid once the front reaches the edges.
+        self.active_region = active_region
+        self.active_window = None
+
+        # Optional spatial index over agents, see enable_index
+        self.index = None
+
     def laplacian(self):       
         return convolve(self.nutrient_grid, self.laplacian_kernel, mode="nearest", cval=0.0)
 
     def diffuse(self):
-        self.nutrient_grid += self.time_step * (self.D_c * self.laplacian())
+        if self.diffusion == "implicit":
+            # Global solve, every cell changes so the active window is unused
+            self._diffuse_implicit()
+        elif self.diffusion == "jit" and diffuse_kernel is not None:
+            self._diffuse_jit(self.time_step)
+        elif self.diffusion == "substep":
+            # Finer time steps, not fewer passes (see __init__)
+            for _ in range(self.substeps):
+                self._diffuse_explicit(self.time_step / self.substeps)
+        else:
+            self._diffuse_explicit(self.time_step)
+
+    # One explicit Euler step over the whole grid or just the active window
+    def _diffuse_explicit(self, dt):
+        if not self.active_region:
+            if self.diffusion == "convolve":
+                self.nutrient_grid += dt * (self.D_c * self.laplacian())
+            else:
+                lap = stencil_laplacian(self.nutrient_grid, self._laplacian_buffer)
+                lap *= dt * self.D_c
+                self.nutrient_grid += lap
+            return
+
+        region = self._grow_active_window()
+        if region is None:
+            return
+        # Laplacian over the window plus a one-cell ring of real neighbours,
+        # only the window part of it is applied
+        r0, r1, c0, c1 = region
+        n = self.grid_size
+        pr0, pr1, pc0, pc1 = max(r0 - 1, 0), min(r1 + 1, n), max(c0 - 1, 0), min(c1 + 1, n)
+        source = self.nutrient_grid[pr0:pr1, pc0:pc1]
+        inner = (slice(r0 - pr0, r1 - pr0), slice(c0 - pc0, c1 - pc0))
+        target = self.nutrient_grid[r0:r1, c0:c1]
+        if self.diffusion == "convolve":
+            lap = convolve(source, self.laplacian_kernel, mode="nearest", cval=0.0)
+            target += dt * (self.D_c * lap[inner])
+        else:
+            lap = stencil_laplacian(source, self._laplacian_buffer[:pr1 - pr0, :pc1 - pc0])[inner]
+            lap *= dt * self.D_c
+            target += lap
+
+    # Compiled explicit step over the whole grid or just the active window
+    def _diffuse_jit(self, dt):
+        if self.active_region:
+            region = self._grow_active_window()
+            if region is None:
+                return
+        else:
+            region = (0, self.grid_size, 0, self.grid_size)
+        diffuse_kernel(self.nutrient_grid, self._laplacian_buffer, *region, dt * self.D_c)
+
+    # Expand the active window on every side whose edge line has left the
+    # plateau. Cells past an edge that is still exactly C_max only have C_max
+    # neighbours, so their Laplacian is zero and they can be skipped exactly.
+    def _grow_active_window(self):
+        if self.active_window is None:
+            return None
+        r0, r1, c0, c1 = self.active_window
+        grid = self.nutrient_grid
+        n = self.grid_size
+        if r0 > 0 and np.any(grid[r0, c0:c1] != self.C_max):
+            r0 -= 1
+        if r1 < n and np.any(grid[r1 - 1, c0:c1] != self.C_max):
+            r1 += 1
+        if c0 > 0 and np.any(grid[r0:r1, c0] != self.C_max):
+            c0 -= 1
+        if c1 < n and np.any(grid[r0:r1, c1 - 1] != self.C_max):
+            c1 += 1
+        self.active_window = (r0, r1, c0, c1)
+        return self.active_window
+
+    # Record that cells in rows r0:r1, columns c0:c1 may differ from C_max
+    def mark_dirty(self, r0, r1, c0, c1):
+        if self.active_window is not None:
+            w0, w1, v0, v1 = self.active_window
+            r0, r1, c0, c1 = min(r0, w0), max(r1, w1), min(c0, v0), max(c1, v1)
+        self.active_window = (int(r0), int(r1), int(c0), int(c1))
+
+    # Backward Euler step. The DCT-II diagonalises the Laplacian with
+    # edge-replicating borders, so the solve is a pointwise division.
+    def _diffuse_implicit(self):
+        key = (self.time_step, self.D_c)
+        if self._implicit_key != key:
+            k = np.arange(self.grid_size)
+            eigenvalues = -4 * np.sin(np.pi * k / (2 * self.grid_size)) ** 2
+            self._implicit_factor = 1 / (1 - self.time_step * self.D_c * (eigenvalues[:, None] + eigenvalues[None, :]))
+            self._implicit_key = key
+        spectrum = dctn(self.nutrient_grid, type=2, norm="ortho", workers=-1)
+        spectrum *= self._implicit_factor
+        self.nutrient_grid[:] = idctn(spectrum, type=2, norm="ortho", workers=-1)
 
     def consume_nutrient(self, x, y, amount):
         self.nutrient_grid[x, y] = max(self.nutrient_grid[x, y] - amount, 0)
+        if self.active_region:
+            self.mark_dirty(x, x + 1, y, y + 1)
+
+    # Consume nutrients for many agents at once. Demand is summed per cell and
+    # when a cell cannot cover it, the available nutrient is shared out in
+    # proportion to each agent's demand. Sorting by (cell, amount) first makes
+    # the sums, and so the result, independent of agent order. Returns the
+    # amount each agent actually got.
+    def consume_nutrients(self, x, y, amounts):
+        amounts = np.asarray(amounts, dtype=float)
+        if len(amounts) == 0:
+            return amounts
+        cells = np.ravel_multi_index((x, y), self.nutrient_grid.shape)
+        order = np.lexsort((amounts, cells))
+        sorted_cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+        touched = sorted_cells[starts]
+        demand = np.add.reduceat(amounts[order], starts)
+
+        flat_grid = self.nutrient_grid.reshape(-1)
+        available = np.maximum(flat_grid[touched], 0)
+        supplied = np.minimum(demand, available)
+        flat_grid[touched] = available - supplied
+        if self.active_region:
+            self.mark_dirty(x.min(), x.max() + 1, y.min(), y.max() + 1)
+
+        share = np.divide(supplied, demand, out=np.ones_like(demand), where=demand > 0)
+        agent_share = np.empty_like(amounts)
+        agent_share[order] = np.repeat(share, np.diff(np.r_[starts, len(cells)]))
+        return amounts * agent_share
 
     def get_nutrient_level(self, x, y):
         return self.nutrient_grid[x, y]
     
     def add_agent(self, agent):
         self.agents.append(agent)
+        if self.index is not None:
+            self.index.insert(agent, agent.x, agent.y)
+
+    # Keep a CellList of agents from now on. `position` maps an agent handle
+    # (an Agent, or an index into a Population) to its (x, y).
+    def enable_index(self, position, tile_size=1):
+        self.index = CellList(position, tile_size)
+
+    def _require_index(self):
+        if self.index is None:
+            raise RuntimeError("Spatial index not enabled, call enable_index first")
+        return self.index
+
+    # Agents in grid cell (x, y)
+    def agents_in_cell(self, x, y):
+        return self._require_index().in_cell(x, y)
+
+    # Agents in grid cells x0..x1, y0..y1 (inclusive)
+    def agents_in_box(self, x0, y0, x1, y1):
+        return self._require_index().in_box(x0, y0, x1, y1)
+
+    # Agents within `radius` of the point (x, y)
+    def agents_within(self, x, y, radius):
+        return self._require_index().within(x, y, radius)
+
+
+# Largest absolute difference between `backend` and the convolve reference
+# after `steps` diffusion steps starting from `grid`
+def diffusion_error(grid, D_c, time_step, backend, steps=10, substeps=4):
+    reference = Petri(len(grid), grid.max(), D_c, time_step)
+    candidate = Petri(len(grid), grid.max(), D_c, time_step, diffusion=backend, substeps=substeps)
+    reference.nutrient_grid[:] = grid
+    candidate.nutrient_grid[:] = grid
+    for _ in range(steps):
+        reference.diffuse()
+        candidate.diffuse()
+    return np.abs(candidate.nutrient_grid - reference.nutrient_grid).max()
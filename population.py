@@ -0,0 +1,248 @@
+import math
+import numpy as np
+
+PI = math.pi
+
+# Per-agent arrays of a Population
+FIELDS = ("x", "y", "mass", "theta", "time_to_change", "imotile")
+
+
+# Structure-of-arrays agent population: every field of Agent is stored in a
+# numpy array and eat/move/replicate run as batched operations per step.
+class Population:
+    # Per-agent arrays (subclasses may add more)
+    fields = FIELDS
+
+    def __init__(self, petri, params, capacity=1024):
+        self.petri = petri
+        self.set_params(params)
+
+        # Arrays are over-allocated, only the first n entries are live agents
+        self.n = 0
+        self.x = np.empty(capacity)
+        self.y = np.empty(capacity)
+        self.mass = np.empty(capacity)
+        self.theta = np.empty(capacity)
+        self.time_to_change = np.empty(capacity, dtype=np.int64)
+        self.imotile = np.empty(capacity, dtype=bool)
+
+        # Dormant agents (see enable_dormancy) are kept out of the arrays above
+        # in a second Population, None while dormancy is off
+        self.dormant = None
+        self.dormancy = None
+
+    # Read the agent parameters, also to change them during a run
+    def set_params(self, params):
+        self.params = params
+        self.r_max = params["r_max"]
+        self.K_m = params["K_m"]
+        self.m_min = params["m_min"]
+        self.m_max = 2*self.m_min
+        self.delta_H = params["delta_H"]
+        self.F_d = params["F_d"]
+        self.mu = params["mu"]
+        self.p = params["p"]
+        self.density = params["density"]
+        self.drag = 4 * PI * self.mu
+        if getattr(self, "dormant", None) is not None:
+            self.dormant.set_params(params)
+
+    # Number of active agents (dormant ones are counted by total_count)
+    def __len__(self):
+        return self.n
+
+    def total_count(self):
+        return self.n + (self.dormant.n if self.dormant is not None else 0)
+
+    # Every field of every agent, active ones first, then dormant ones
+    def all_fields(self):
+        n = self.n
+        if self.dormant is None:
+            return {name: getattr(self, name)[:n] for name in self.fields}
+        d = self.dormant.n
+        return {name: np.concatenate((getattr(self, name)[:n], getattr(self.dormant, name)[:d])) for name in self.fields}
+
+    # From now on, imotile agents whose cell holds less than `level` nutrient
+    # after eating are set aside as dormant and skipped by every step, and
+    # woken when diffusion brings their cell back above `wake_level` (twice
+    # `level` by default). Their uptake below `level` is neglected.
+    def enable_dormancy(self, level, wake_level=None):
+        if self.petri.index is not None:
+            raise ValueError("Dormancy is not available with a spatial index")
+        self.dormancy = (level, 2 * level if wake_level is None else wake_level)
+        if self.dormant is None:
+            self.dormant = Population(self.petri, self.params)
+
+    # Set aside imotile agents in starved cells
+    def freeze(self):
+        if self.dormancy is None or self.n == 0:
+            return
+        ix, iy = self.cells()
+        resting = np.flatnonzero(self.imotile[:self.n] & (self.petri.nutrient_grid[ix, iy] < self.dormancy[0]))
+        if len(resting):
+            self.dormant.insert_agents(self.remove_agents(resting))
+
+    # Bring back dormant agents whose cell has nutrient again
+    def wake(self):
+        if self.dormancy is None or self.dormant.n == 0:
+            return
+        ix, iy = self.dormant.cells()
+        waking = np.flatnonzero(self.petri.nutrient_grid[ix, iy] > self.dormancy[1])
+        if len(waking):
+            self.insert_agents(self.dormant.remove_agents(waking))
+
+    # Grow the backing arrays so at least `needed` agents fit
+    def _reserve(self, needed):
+        capacity = len(self.x)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in self.fields:
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    # Append new agents (same initial state as Agent.__init__)
+    def add_agents(self, x, y, mass):
+        count = len(x)
+        self._reserve(self.n + count)
+        s = slice(self.n, self.n + count)
+        self.x[s] = x
+        self.y[s] = y
+        self.mass[s] = mass
+        self.theta[s] = self.petri.rng.thetas(count)
+        self.time_to_change[s] = self.petri.rng.run_lengths(count)
+        self.imotile[s] = False
+        index = self.petri.index
+        if index is not None:
+            for i in range(self.n, self.n + count):
+                index.insert(i, self.x[i], self.y[i])
+        self.n += count
+
+    # Append agents with every field given, e.g. taken from another
+    # Population by remove_agents
+    def insert_agents(self, fields):
+        count = len(fields["x"])
+        self._reserve(self.n + count)
+        for name in self.fields:
+            getattr(self, name)[self.n:self.n + count] = fields[name]
+        self.n += count
+
+    # Remove the agents at `indices` (keeping the others in order) and return
+    # their fields. Not available with a spatial index, whose handles are
+    # positions in the arrays.
+    def remove_agents(self, indices):
+        if self.petri.index is not None:
+            raise RuntimeError("Cannot remove agents from a population with a spatial index")
+        n = self.n
+        keep = np.ones(n, dtype=bool)
+        keep[indices] = False
+        removed = {name: getattr(self, name)[:n][indices].copy() for name in self.fields}
+        kept = int(np.count_nonzero(keep))
+        for name in self.fields:
+            values = getattr(self, name)
+            values[:kept] = values[:n][keep]
+        self.n = kept
+        return removed
+
+    # Grid cell each agent sits in (same rounding as round() in Agent)
+    def cells(self):
+        return (np.rint(self.x[:self.n]).astype(np.intp),
+                np.rint(self.y[:self.n]).astype(np.intp))
+
+    # Velocity from drag and radius, as in Agent.update_properties
+    def velocity(self, mass):
+        size = mass / self.density
+        if np.any(size < 0):
+            print(f"[WARNING] {np.count_nonzero(size < 0)} agent sizes negative")
+        radius = np.sqrt(size / PI)
+        return self.F_d / (self.drag * radius)
+
+    # Consume nutrients if available (Monod uptake). With dormancy on, dormant
+    # agents whose cell recovered rejoin first and starved ones leave after.
+    def eat(self):
+        self.wake()
+        self._eat()
+        self.freeze()
+
+    def _eat(self):
+        n = self.n
+        mass = self.mass[:n]
+        ix, iy = self.cells()
+        grid = self.petri.nutrient_grid
+
+        # Agent state stays float64 whatever the precision of the grid
+        nutrient_level = grid[ix, iy].astype(float, copy=False)
+        nutrients_taken = (self.r_max * nutrient_level) / (self.K_m + nutrient_level)
+
+        # Agents sharing a cell split what is there instead of racing for it
+        nutrients_taken = self.petri.consume_nutrients(ix, iy, nutrients_taken)
+        mass += self.p * nutrients_taken * (mass / self.density)
+
+        self.imotile[:n] = self.m_min > mass
+
+    # Move agents that are big enough, turning when their run ends
+    def move(self):
+        n = self.n
+        mass = self.mass[:n]
+        time_to_change = self.time_to_change[:n]
+        motile = ~self.imotile[:n] & (self.m_min <= mass) & (mass < self.m_max)
+
+        running = np.flatnonzero(motile & (time_to_change > 0))
+        turning = np.flatnonzero(motile & (time_to_change <= 0))
+        if len(running):
+            velocity = self.velocity(mass[running])
+            theta = self.theta[running]
+            limit = self.petri.grid_size - 1
+            old_x, old_y = self.x[running], self.y[running]
+            self.x[running] = np.clip(old_x + velocity * np.cos(theta), 0, limit)
+            self.y[running] = np.clip(old_y + velocity * np.sin(theta), 0, limit)
+            if self.petri.index is not None:
+                self._reindex(running, old_x, old_y)
+
+            work_done = abs(self.F_d) * velocity
+            mass[running] -= work_done / self.delta_H
+            time_to_change[running] -= 1
+
+        if len(turning):
+            self.turn(turning)
+
+    # New headings and run lengths for the agents at `turning`
+    def turn(self, turning):
+        self.theta[turning] = self.petri.rng.thetas(len(turning))
+        self.time_to_change[turning] = self.petri.rng.run_lengths(len(turning))
+
+    # Re-bucket moved agents whose index tile changed
+    def _reindex(self, moved, old_x, old_y):
+        index = self.petri.index
+        ts = index.tile_size
+        new_x, new_y = self.x[moved], self.y[moved]
+        changed = ((np.rint(old_x) // ts != np.rint(new_x) // ts) |
+                   (np.rint(old_y) // ts != np.rint(new_y) // ts))
+        for i in moved[changed].tolist():
+            index.move(i, self.x[i], self.y[i])
+
+    # Replicate agents over mass_max into a random Moore neighbour
+    def replicate(self):
+        n = self.n
+        mass = self.mass[:n]
+        parents = np.flatnonzero(~self.imotile[:n] & (mass >= self.m_max))
+        if len(parents) == 0:
+            return
+
+        # Pick one of the 8 nonzero directions uniformly
+        dx, dy = self.petri.rng.directions(len(parents))
+
+        limit = self.petri.grid_size - 1
+        new_x = np.clip(self.x[parents] + dx, 0, limit)
+        new_y = np.clip(self.y[parents] + dy, 0, limit)
+        mass[parents] /= 2
+        self.add_agents(new_x, new_y, mass[parents])
+
+    # Advance every agent by one simulation step
+    def step(self):
+        self.eat()
+        self.move()
+        self.replicate()
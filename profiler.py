@@ -0,0 +1,106 @@
+import csv
+import json
+import os
+import time
+import tracemalloc
+
+# Phases timed by SimulationState.update ("agents" is the whole agent step of
+# the object and jit engines) and by the run loops around it
+PROFILE_PHASES = ["pre_step", "eat", "move", "replicate", "agents", "diffuse", "post_step",
+                  "render", "frames", "snapshot", "checkpoint"]
+
+
+# Times one phase, reused for every step so timing allocates nothing
+class _Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.window[self.name] += time.perf_counter() - self.start
+
+
+# Per-phase wall time, agent counts, steps/second and (optionally) memory
+# allocated by Python, summarised every `interval` steps. Set it as
+# SimulationState.profiler; summaries are printed (with `echo`) and appended
+# to `filename` as CSV rows, or JSON lines for a .json/.jsonl file.
+class Profiler:
+    def __init__(self, interval=1000, filename=None, allocations=False, echo=True, phases=PROFILE_PHASES):
+        self.interval = interval
+        self.filename = filename
+        self.allocations = allocations
+        self.echo = echo
+        self.phases = list(phases)
+        self.timers = {name: _Phase(self, name) for name in self.phases}
+        self.window = dict.fromkeys(self.phases, 0.0)
+        self.summaries = []
+        self.steps = 0
+        self.window_start = time.perf_counter()
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if filename and self._is_csv() and not os.path.exists(filename):
+            with open(filename, 'w', newline='') as f:
+                csv.DictWriter(f, fieldnames=self.fields()).writeheader()
+
+    def _is_csv(self):
+        return not self.filename.endswith((".json", ".jsonl"))
+
+    # Columns of a summary row
+    def fields(self):
+        fields = ["iteration", "steps", "steps_per_s", "agents"] + [f"{name}_ms" for name in self.phases]
+        if self.allocations:
+            fields += ["alloc_current_kb", "alloc_peak_kb"]
+        return fields
+
+    # Context manager timing `name` (one of `phases`)
+    def phase(self, name):
+        try:
+            return self.timers[name]
+        except KeyError:
+            raise ValueError(f"Unknown profiling phase: {name}") from None
+
+    # Called by SimulationState.update at the end of every step
+    def end_step(self, state):
+        self.steps += 1
+        if self.steps >= self.interval:
+            self.summarise(state)
+
+    # Summary of the steps since the last one: mean milliseconds per step of
+    # every phase, then start a new window
+    def summarise(self, state):
+        now = time.perf_counter()
+        steps = max(self.steps, 1)
+        row = {
+            "iteration": state.iteration,
+            "steps": self.steps,
+            "steps_per_s": self.steps / (now - self.window_start),
+            "agents": state.agent_count(),
+        }
+        for name in self.phases:
+            row[f"{name}_ms"] = 1000 * self.window[name] / steps
+            self.window[name] = 0.0
+        if self.allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            row["alloc_current_kb"] = current / 1024
+            row["alloc_peak_kb"] = peak / 1024
+            tracemalloc.reset_peak()
+        self.summaries.append(row)
+        self.steps = 0
+        self.window_start = now
+
+        if self.echo:
+            busy = sorted((row[f"{name}_ms"], name) for name in self.phases if row[f"{name}_ms"] > 0)
+            phases = ", ".join(f"{name} {ms:.3f}" for ms, name in reversed(busy))
+            print(f"[profile] iteration {row['iteration']}: {row['steps_per_s']:.1f} steps/s, "
+                  f"{row['agents']} agents, ms/step: {phases}")
+        if self.filename:
+            with open(self.filename, 'a', newline='') as f:
+                if self._is_csv():
+                    csv.DictWriter(f, fieldnames=self.fields()).writerow(row)
+                else:
+                    f.write(json.dumps(row) + "\n")
+        return row
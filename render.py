@@ -0,0 +1,40 @@
+import numpy as np
+
+AGENT_COLOUR = (229, 89, 52)
+IMOTILE_COLOUR = (0, 0, 0)
+
+
+# Colour lookup table for the nutrient map: entry i is the display colour at
+# percent_diff = i / (levels - 1), where percent_diff = 1 - nutrient / C_max
+def nutrient_lut(levels=256):
+    percent_diff = np.linspace(0, 1, levels)
+    return np.stack([79 + (146 * percent_diff).astype(int),
+                     53 + (175 * percent_diff).astype(int),
+                     155 + (66 * percent_diff).astype(int)], axis=1).astype(np.uint8)
+
+
+# Every colour a rendered dish can contain, as one 256-entry palette (so it
+# also works for GIFs): the nutrient ramp followed by the two agent colours
+NUTRIENT_LEVELS = 254
+AGENT_INDEX = 254
+IMOTILE_INDEX = 255
+PALETTE = np.concatenate((nutrient_lut(NUTRIENT_LEVELS),
+                          np.array([AGENT_COLOUR, IMOTILE_COLOUR], dtype=np.uint8)))
+
+
+# Palette index image of the dish, shape (grid_size, grid_size) indexed
+# [x, y] like the nutrient grid, with agents drawn over the nutrient map
+def render_indices(nutrient_grid, c_max, x, y, imotile):
+    top = NUTRIENT_LEVELS - 1
+    levels = (1 - nutrient_grid / c_max) * top
+    np.clip(levels, 0, top, out=levels)
+    indices = levels.astype(np.uint8)
+    indices[np.asarray(x).astype(np.intp), np.asarray(y).astype(np.intp)] = \
+        np.where(imotile, IMOTILE_INDEX, AGENT_INDEX)
+    return indices
+
+
+# RGB image of the dish, shape (grid_size, grid_size, 3) indexed [x, y]
+# (which is also pygame.surfarray's layout)
+def render_frame(nutrient_grid, c_max, x, y, imotile):
+    return PALETTE[render_indices(nutrient_grid, c_max, x, y, imotile)]
@@ -0,0 +1,66 @@
+import math
+import numpy as np
+
+PI = math.pi
+
+# Moore neighbourhood offsets a dividing agent can place its daughter at
+DIRECTIONS = np.array([(-1, -1), (-1, 0), (-1, 1),
+                       (0, -1),           (0, 1),
+                       (1, -1),  (1, 0),  (1, 1)])
+
+
+# Random numbers for one simulation. Each stream owns a numpy Generator and
+# pre-draws thetas, Poisson run lengths and division directions in blocks,
+# so agents only index into arrays and runs don't share global random state.
+class RandomStream:
+    KINDS = ("theta", "run_length", "direction")
+
+    def __init__(self, seed=None, block_size=4096):
+        self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+        self.buffers = {kind: np.empty(0) for kind in self.KINDS}
+        self.positions = {kind: 0 for kind in self.KINDS}
+
+    def _draw(self, kind, size):
+        if kind == "theta":
+            return self.generator.uniform(0, 2 * PI, size)
+        if kind == "run_length":
+            return self.generator.poisson(10, size)
+        return self.generator.integers(0, len(DIRECTIONS), size)
+
+    # Next n values of a kind, refilling its block when it runs out
+    def _take(self, kind, n):
+        buffer, pos = self.buffers[kind], self.positions[kind]
+        if pos + n > len(buffer):
+            fresh = self._draw(kind, max(self.block_size, n))
+            buffer = np.concatenate((buffer[pos:], fresh)) if pos < len(buffer) else fresh
+            self.buffers[kind] = buffer
+            pos = 0
+        self.positions[kind] = pos + n
+        return buffer[pos:pos + n]
+
+    # Scalar draws (used by Agent)
+    def theta(self):
+        return float(self._take("theta", 1)[0])
+
+    def run_length(self):
+        return int(self._take("run_length", 1)[0])
+
+    def direction(self):
+        dx, dy = DIRECTIONS[self._take("direction", 1)[0]]
+        return int(dx), int(dy)
+
+    # Bulk draws (used by Population)
+    def thetas(self, n):
+        return self._take("theta", n)
+
+    def run_lengths(self, n):
+        return self._take("run_length", n)
+
+    def directions(self, n):
+        offsets = DIRECTIONS[self._take("direction", n)]
+        return offsets[:, 0], offsets[:, 1]
+
+    # Uniform draws straight from the generator (initial placement)
+    def uniform(self, low, high, size=None):
+        return self.generator.uniform(low, high, size)
@@ -1,12 +1,24 @@
 
-from agent import Agent
-from petri import Petri
-import numpy.random as npr
+from agent import Agent, AgentParams
+from petri import Petri, PRECISIONS
+from population import Population
+from kernels import JitPopulation
+from rng import RandomStream
+from agent_data import save_agents
+import contextlib
+import numpy as np
 import json
 
+# Stands in for a profiler phase when profiling is off
+_UNTIMED = contextlib.nullcontext()
+
 
 class SimulationState:
-    def __init__(self, grid_size, agent_params, c_max, d_c, time_step, seed, num_agents, max_iters):
+    def __init__(self, grid_size, agent_params, c_max, d_c, time_step, seed, num_agents, max_iters, engine="object", diffusion="convolve", active_region=False, spatial_index=None, dormancy=None, precision="float64"):
+        if engine not in ("object", "vector", "jit"):
+            raise ValueError(f"Unknown engine: {engine}")
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}")
         self.grid_size = grid_size
         self.agent_params = agent_params.copy()
         self.c_max = c_max
@@ -18,16 +30,59 @@ class SimulationState:
         self.paused = True
         self.running = True
         self.max_iters = max_iters
+        # 'object' steps each Agent in turn, 'vector' steps a Population of
+        # arrays, 'jit' steps it with compiled kernels (see kernels.py)
+        self.engine = engine
+        # Diffusion backend used by the Petri dish (see petri.DIFFUSION_BACKENDS)
+        self.diffusion = diffusion
+        # Only diffuse the region the colony has disturbed (explicit backends)
+        self.active_region = active_region
+        # Tile size of the Petri spatial index over agents, None to disable
+        self.spatial_index = spatial_index
+        # Nutrient level below which imotile agents go dormant and are
+        # skipped until their cell recovers (see Population.enable_dormancy),
+        # None to step every agent
+        self.dormancy = dormancy
+        # dtype of the nutrient grid, 'float32' halves its memory
+        self.precision = precision
+        # Functions of the state called before and after every step
+        self.pre_step_hooks = []
+        self.post_step_hooks = []
+        # Objects with an observe(state) method, called after every step
+        self.observers = []
+        # profiler.Profiler timing every phase of a step, None when off
+        self.profiler = None
         self._init_petri()
 
     # Initialize the Petri dish with agents
     def _init_petri(self):
-        self.petri = Petri(self.grid_size, self.c_max, self.d_c, self.time_step)
+        # Fresh stream from the seed, so every reset replays the same run
+        self.rng = RandomStream(self.seed)
+        self.petri = Petri(self.grid_size, self.c_max, self.d_c, self.time_step, diffusion=self.diffusion, active_region=self.active_region, rng=self.rng, dtype=self.precision)
+        # Parameters shared by every Agent of the object engine
+        self.shared_agent_params = AgentParams(self.agent_params)
         self.petri.agents = []
+        self.dormant_agents = []
+        self._dormant_cells = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+        self.population = None
         center = self.grid_size // 2
-        for _ in range(self.num_agents):
-            agent = Agent(center+int(npr.uniform(-25,25)), center+int(npr.uniform(-25,25)), self.agent_params["m_min"], self.petri, self.agent_params)
-            self.petri.add_agent(agent)
+        if self.engine in ("vector", "jit"):
+            population_class = JitPopulation if self.engine == "jit" else Population
+            self.population = population_class(self.petri, self.agent_params)
+            if self.spatial_index:
+                population = self.population
+                self.petri.enable_index(lambda i: (population.x[i], population.y[i]), self.spatial_index)
+            x = center + self.rng.uniform(-25, 25, self.num_agents).astype(int)
+            y = center + self.rng.uniform(-25, 25, self.num_agents).astype(int)
+            self.population.add_agents(x, y, np.full(self.num_agents, float(self.agent_params["m_min"])))
+            if self.dormancy is not None:
+                self.population.enable_dormancy(self.dormancy)
+        else:
+            if self.spatial_index:
+                self.petri.enable_index(lambda agent: (agent.x, agent.y), self.spatial_index)
+            for _ in range(self.num_agents):
+                agent = Agent(center+int(self.rng.uniform(-25,25)), center+int(self.rng.uniform(-25,25)), self.agent_params["m_min"], self.petri, self.shared_agent_params)
+                self.petri.add_agent(agent)
         self.iteration = 0
 
     # Start from beginning
@@ -44,24 +99,108 @@ class SimulationState:
     def update(self):
         if self.paused:
             return
-        for agent in self.petri.agents:
-            agent.eat()
-            if not agent.imotile:
-                agent.move()
-                new_agent = agent.replicate()
-                if new_agent:
-                    self.petri.add_agent(new_agent)
-        self.petri.diffuse()
+        phase = self.phase
+        with phase("pre_step"):
+            for hook in self.pre_step_hooks:
+                hook(self)
+        if self.engine == "jit":
+            # eat and move are one fused pass
+            with phase("agents"):
+                self.population.step()
+        elif self.population is not None:
+            with phase("eat"):
+                self.population.eat()
+            with phase("move"):
+                self.population.move()
+            with phase("replicate"):
+                self.population.replicate()
+        else:
+            with phase("agents"):
+                if self.dormancy is not None:
+                    self._wake_agents()
+                for agent in self.petri.agents:
+                    agent.eat()
+                    if not agent.imotile:
+                        agent.move()
+                        new_agent = agent.replicate()
+                        if new_agent:
+                            self.petri.add_agent(new_agent)
+                if self.dormancy is not None:
+                    self._freeze_agents()
+        with phase("diffuse"):
+            self.petri.diffuse()
         self.iteration += 1
+        with phase("post_step"):
+            for hook in self.post_step_hooks:
+                hook(self)
+            for observer in self.observers:
+                observer.observe(self)
+        if self.profiler is not None:
+            self.profiler.end_step(self)
+
+
+    # Object engine: set aside imotile agents in starved cells
+    def _freeze_agents(self):
+        grid = self.petri.nutrient_grid
+        active, resting = [], []
+        for agent in self.petri.agents:
+            starved = agent.imotile and grid[round(agent.x), round(agent.y)] < self.dormancy
+            (resting if starved else active).append(agent)
+        if resting:
+            self.petri.agents = active
+            self._set_dormant(self.dormant_agents + resting)
+
+    # Object engine: bring back dormant agents whose cell has nutrient again,
+    # checked for all of them at once
+    def _wake_agents(self):
+        if not self.dormant_agents:
+            return
+        waking = self.petri.nutrient_grid[self._dormant_cells] > 2 * self.dormancy
+        if waking.any():
+            self.petri.agents.extend(agent for agent, wake in zip(self.dormant_agents, waking) if wake)
+            self._set_dormant([agent for agent, wake in zip(self.dormant_agents, waking) if not wake])
+
+    def _set_dormant(self, agents):
+        self.dormant_agents = agents
+        self._dormant_cells = (np.array([round(agent.x) for agent in agents], dtype=np.intp),
+                               np.array([round(agent.y) for agent in agents], dtype=np.intp))
 
+    # Context manager timing a phase of the run when profiling is on
+    def phase(self, name):
+        if self.profiler is None:
+            return _UNTIMED
+        return self.profiler.phase(name)
 
-    # Updates parameters of the simulation
-    def set_params(self, key, value):
+
+    # Number of agents in the dish
+    def agent_count(self):
+        if self.population is not None:
+            return self.population.total_count()
+        return len(self.petri.agents) + len(self.dormant_agents)
+
+
+    # Agent x, y, mass and imotile flags as arrays (for either engine)
+    def agent_arrays(self):
+        if self.population is not None:
+            fields = self.population.all_fields()
+            return fields["x"], fields["y"], fields["mass"], fields["imotile"]
+        agents = self.petri.agents + self.dormant_agents
+        return (np.array([agent.x for agent in agents], dtype=float),
+                np.array([agent.y for agent in agents], dtype=float),
+                np.array([agent.mass for agent in agents], dtype=float),
+                np.array([agent.imotile for agent in agents], dtype=bool))
+
+
+    # Updates parameters of the simulation. With restart=False agent
+    # parameters, d_c and time_step apply to the running simulation (seed,
+    # num_agents and c_max only make sense from the beginning, so they
+    # always restart it)
+    def set_params(self, key, value, restart=True):
         if key in self.agent_params:
             self.agent_params[key] = value
         elif key == "d_c":
             self.d_c = value
-            self.petri.D_C = value
+            self.petri.D_c = value
         elif key == "time_step":
             self.time_step = value
             self.petri.time_step = value
@@ -71,15 +210,29 @@ class SimulationState:
             self.c_max = value
         elif key == 'seed':
             self.seed = value
-            npr.seed(value)
         else: 
             print(f"Invalid parameter key: {key}")
             return
+        if not restart and key not in ("num_agents", "c_max", "seed"):
+            self._apply_agent_params()
+            return
         # Start from beginning if parameters change
         self.reset()
 
+    # Hand changed agent parameters to the agents already in the dish
+    def _apply_agent_params(self):
+        if self.population is not None:
+            self.population.set_params(self.agent_params)
+        else:
+            self.shared_agent_params.update(self.agent_params)
 
+
+    # Save the agents to `filename`: columns in a .npz file (see
+    # agent_data.save_agents), otherwise the legacy per-agent JSON
     def save_data(self, filename):
+        if filename.endswith(".npz"):
+            save_agents(self, filename)
+            return
         data = {
             "simulation_params": {
                 "grid_size": self.grid_size,
@@ -93,11 +246,11 @@ class SimulationState:
             "agent_params": self.agent_params,
             "agents": [
                 {
-                    "x": agent.x,
-                    "y": agent.y,
-                    "mass": agent.mass
+                    "x": float(x),
+                    "y": float(y),
+                    "mass": float(mass)
                 }
-                for agent in self.petri.agents
+                for x, y, mass, _ in zip(*self.agent_arrays())
             ]
         }   
         with open(filename, 'w') as f:
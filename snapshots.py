@@ -0,0 +1,112 @@
+import os
+import queue
+import threading
+import numpy as np
+from PIL import Image
+from render import PALETTE, render_indices
+
+DROP_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+
+# Immutable copy of everything needed to render one frame, so the simulation
+# can keep stepping while the frame is written
+class Frame:
+    def __init__(self, state, filename=None):
+        x, y, _, imotile = state.agent_arrays()
+        self.filename = filename
+        self.iteration = state.iteration
+        self.c_max = state.petri.C_max
+        self.nutrient_grid = state.petri.nutrient_grid.copy()
+        self.x = x.copy()
+        self.y = y.copy()
+        self.imotile = imotile.copy()
+
+    # Dish palette indices, indexed [x, y]
+    def render(self):
+        return render_indices(self.nutrient_grid, self.c_max, self.x, self.y, self.imotile)
+
+
+# Renders frames on a background thread and writes them as PNG files and/or
+# into a gif_creator.MovieWriter given as `movie`. Frames wait in a bounded
+# queue; when it is full, 'block' makes submit wait (backpressure),
+# 'drop_newest' discards the submitted frame and 'drop_oldest' discards the
+# oldest queued frame to make room. If a write fails, the thread discards
+# the frames still to come (so submit never waits on it) and the error is
+# raised by the next submit or close.
+class FrameWriter:
+    def __init__(self, maxsize=8, policy="block", scale=2, movie=None):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.policy = policy
+        self.scale = scale
+        self.movie = movie
+        self.written = 0
+        self.dropped = 0
+        self.failed = False
+        self.error = None
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # Queue a snapshot of the state to be saved as `filename` (if given) and
+    # added to the movie (if any), returns False if it was dropped
+    def submit(self, state, filename=None):
+        self._raise_error()
+        frame = Frame(state, filename)
+        if self.policy == "block":
+            self.queue.put(frame)
+            return True
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return True
+            except queue.Full:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return False
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    # Write whatever is still queued and stop the thread (closing the movie)
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.movie is not None:
+            self.movie.close()
+        self._raise_error()
+
+    # Raise the write error, once
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.failed:
+                continue
+            try:
+                self.write(frame)
+            except Exception as error:
+                self.failed = True
+                self.error = error
+
+    def write(self, frame):
+        indices = frame.render()
+        if frame.filename:
+            # Frames are indexed [x, y], images are rows of y
+            image = Image.fromarray(np.ascontiguousarray(indices.T), "P")
+            image.putpalette(PALETTE.tobytes())
+            if self.scale != 1:
+                image = image.resize((image.width * self.scale, image.height * self.scale), Image.NEAREST)
+            os.makedirs(os.path.dirname(frame.filename) or ".", exist_ok=True)
+            image.save(frame.filename)
+        if self.movie is not None:
+            self.movie.append_indices(indices)
+        self.written += 1
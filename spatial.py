@@ -0,0 +1,85 @@
+import math
+
+
+# Uniform grid index over agents. Agents are bucketed by the tile that their
+# grid cell (round(x), round(y)) falls in, so per-cell and neighbourhood
+# queries only look at nearby buckets. Items can be any hashable handle
+# (Agent objects or population indices); `position` maps a handle to (x, y).
+class CellList:
+    def __init__(self, position, tile_size=1):
+        self.position = position
+        self.tile_size = tile_size
+        self.tiles = {}
+        self.tile_of = {}
+
+    def __len__(self):
+        return len(self.tile_of)
+
+    def _tile(self, x, y):
+        return (round(x) // self.tile_size, round(y) // self.tile_size)
+
+    def insert(self, item, x, y):
+        tile = self._tile(x, y)
+        self.tile_of[item] = tile
+        self.tiles.setdefault(tile, set()).add(item)
+
+    def remove(self, item):
+        tile = self.tile_of.pop(item)
+        bucket = self.tiles[tile]
+        bucket.discard(item)
+        if not bucket:
+            del self.tiles[tile]
+
+    # Re-bucket an item after it moved (no-op while it stays in its tile)
+    def move(self, item, x, y):
+        tile = self._tile(x, y)
+        old = self.tile_of[item]
+        if tile == old:
+            return
+        bucket = self.tiles[old]
+        bucket.discard(item)
+        if not bucket:
+            del self.tiles[old]
+        self.tile_of[item] = tile
+        self.tiles.setdefault(tile, set()).add(item)
+
+    def clear(self):
+        self.tiles = {}
+        self.tile_of = {}
+
+    # All items whose tile overlaps cells x0..x1, y0..y1 (inclusive)
+    def _candidates(self, x0, y0, x1, y1):
+        ts = self.tile_size
+        found = []
+        for tx in range(math.floor(x0) // ts, math.floor(x1) // ts + 1):
+            for ty in range(math.floor(y0) // ts, math.floor(y1) // ts + 1):
+                bucket = self.tiles.get((tx, ty))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    # Items in grid cell (x, y)
+    def in_cell(self, x, y):
+        if self.tile_size == 1:
+            return list(self.tiles.get((x, y), ()))
+        return [item for item in self._candidates(x, y, x, y)
+                if (round(self.position(item)[0]), round(self.position(item)[1])) == (x, y)]
+
+    # Items in grid cells x0..x1, y0..y1 (inclusive)
+    def in_box(self, x0, y0, x1, y1):
+        found = []
+        for item in self._candidates(x0, y0, x1, y1):
+            x, y = self.position(item)
+            if x0 <= round(x) <= x1 and y0 <= round(y) <= y1:
+                found.append(item)
+        return found
+
+    # Items within `radius` of the point (x, y)
+    def within(self, x, y, radius):
+        found = []
+        r2 = radius * radius
+        for item in self._candidates(x - radius - 1, y - radius - 1, x + radius + 1, y + radius + 1):
+            ax, ay = self.position(item)
+            if (ax - x) ** 2 + (ay - y) ** 2 <= r2:
+                found.append(item)
+        return found
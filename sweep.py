@@ -0,0 +1,202 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from config import DEFAULTS, load_config, build_state, build_ensemble, dimensionless_groups
+from fractal import occupancy_grid, box_count_dimension, lacunarity_exponent
+from cache import ResultCache
+
+# Parameters a sweep may vary, besides the seed
+SWEEP_PARAMS = list(DEFAULTS["agent_params"]) + ["c_max", "d_c"]
+
+RESULT_FIELDS = ["key", "seed"] + SWEEP_PARAMS + ["A", "B", "C", "D", "E",
+                 "iterations", "agents", "imotile_fraction", "box_dimension", "box_ci_low", "box_ci_high", "box_r2",
+                 "lacunarity_exponent", "runtime"]
+
+
+# Every combination of the listed values
+def grid_points(values):
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(values[name] for name in names))]
+
+
+# Latin hypercube sample: `samples` points with each (low, high) range cut into
+# `samples` strata and every stratum used exactly once per parameter
+def latin_hypercube(ranges, samples, rng):
+    points = [{} for _ in range(samples)]
+    for name, (low, high) in ranges.items():
+        strata = (rng.permutation(samples) + rng.uniform(size=samples)) / samples
+        for point, u in zip(points, strata):
+            point[name] = float(low + u * (high - low))
+    return points
+
+
+# Pair every parameter point with `replicates` seeds. Seeds come from
+# independent SeedSequence children so every run has its own random stream.
+def with_seeds(points, replicates, sweep_seed):
+    children = np.random.SeedSequence(sweep_seed).spawn(len(points) * replicates)
+    seeded = []
+    for i, point in enumerate(points):
+        for r in range(replicates):
+            seeded.append(dict(point, seed=int(children[i * replicates + r].generate_state(1)[0])))
+    return seeded
+
+
+# Stable identifier of a run (point + fixed settings), used to resume sweeps
+def point_key(point, base):
+    text = json.dumps({"point": point, "base": base}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+# Config overrides for one point, agent parameters go under agent_params
+def point_overrides(point, base):
+    overrides = json.loads(json.dumps(base))
+    agent_params = overrides.setdefault("agent_params", {})
+    for name, value in point.items():
+        if name in DEFAULTS["agent_params"]:
+            agent_params[name] = value
+        else:
+            overrides[name] = value
+    return overrides
+
+
+# Run one simulation to completion and measure the final colony. With a
+# cache folder, runs and measurements are taken from (and added to) a
+# ResultCache there.
+def run_point(point, base, cache_path=None):
+    start = time.perf_counter()
+    config = load_config(overrides=point_overrides(point, base))
+    cache = ResultCache(cache_path) if cache_path else None
+    if cache is not None:
+        state = cache.run(config)
+    else:
+        state = build_state(config)
+        state.paused = False
+        while state.iteration < state.max_iters and state.agent_count() < config["max_agents"]:
+            state.update()
+
+    x, y, _, imotile = state.agent_arrays()
+    if hasattr(state, "close"):
+        state.close()
+    return result_row(point, base, config, state.iteration, x, y, imotile, time.perf_counter() - start, cache)
+
+
+# Run points that differ only in their seed together as one Ensemble,
+# returns a result row per point (the runtime is shared out evenly)
+def run_ensemble(points, base, cache_path=None):
+    start = time.perf_counter()
+    cache = ResultCache(cache_path) if cache_path else None
+    config = load_config(overrides=point_overrides(points[0], base))
+    results = build_ensemble(config, [point["seed"] for point in points]).run()
+    runtime = (time.perf_counter() - start) / len(points)
+    return [result_row(point, base, dict(config, seed=point["seed"]), result["iteration"], result["x"], result["y"],
+                       result["imotile"], runtime, cache) for point, result in zip(points, results)]
+
+
+# Measure a finished colony (through the cache's memo if there is one)
+def result_row(point, base, config, iterations, x, y, imotile, runtime, cache=None):
+    measure = cache.memo if cache is not None else (lambda fn, *args: fn(*args))
+    grid = occupancy_grid(x, y, config["grid_size"])
+    fit = measure(box_count_dimension, grid)
+    row = {"key": point_key(point, base), "seed": config["seed"]}
+    row.update({name: config["agent_params"].get(name, config.get(name)) for name in SWEEP_PARAMS})
+    row.update(dimensionless_groups(config["agent_params"], config["c_max"], config["d_c"]))
+    row.update({
+        "iterations": iterations,
+        "agents": len(x),
+        "imotile_fraction": float(np.mean(imotile)) if len(imotile) else 0.0,
+        "box_dimension": fit["dimension"],
+        "box_ci_low": fit["ci_low"],
+        "box_ci_high": fit["ci_high"],
+        "box_r2": fit["r2"],
+        "lacunarity_exponent": measure(lacunarity_exponent, grid),
+        "runtime": runtime,
+    })
+    return row
+
+
+# Points grouped by everything but their seed, in order of first appearance
+def replicate_groups(points):
+    groups = {}
+    for point in points:
+        groups.setdefault(json.dumps({k: v for k, v in point.items() if k != "seed"}, sort_keys=True), []).append(point)
+    return list(groups.values())
+
+
+# Keys already in a results table
+def completed_keys(results_path):
+    if not os.path.exists(results_path):
+        return set()
+    with open(results_path, newline='') as f:
+        return {row["key"] for row in csv.DictReader(f)}
+
+
+# Run every point not already in results_path across a process pool,
+# appending each result row as soon as it finishes. With `ensemble`, the
+# replicates of each parameter point run together as one Ensemble. With a
+# `cache_path`, runs and measurements go through a ResultCache there.
+def run_sweep(points, base, results_path, workers=None, ensemble=False, cache_path=None):
+    done = completed_keys(results_path)
+    todo = [point for point in points if point_key(point, base) not in done]
+    print(f"{len(points)} points, {len(points) - len(todo)} already done, {len(todo)} to run")
+    if not todo:
+        return
+
+    new_file = not os.path.exists(results_path)
+    with open(results_path, 'a', newline='') as f, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        if ensemble:
+            futures = [pool.submit(run_ensemble, group, base, cache_path) for group in replicate_groups(todo)]
+        else:
+            futures = [pool.submit(run_point, point, base, cache_path) for point in todo]
+        n = 0
+        for future in as_completed(futures):
+            rows = future.result()
+            for row in rows if ensemble else [rows]:
+                n += 1
+                writer.writerow(row)
+                print(f"[{n}/{len(todo)}] dimension {row['box_dimension']:.3f}, "
+                      f"{row['agents']} agents after {row['iterations']} iterations")
+            f.flush()
+
+
+# Points described by a sweep spec:
+# {"grid": {name: [values]}} or {"lhs": {name: [low, high]}, "samples": n},
+# plus optional "replicates", "sweep_seed" and "base" (fixed config overrides)
+def points_from_spec(spec):
+    if "grid" in spec:
+        points = grid_points(spec["grid"])
+    else:
+        points = latin_hypercube(spec["lhs"], spec["samples"], np.random.default_rng(spec.get("sweep_seed", 0)))
+    for point in points:
+        for name in point:
+            if name not in SWEEP_PARAMS:
+                raise ValueError(f"Invalid sweep parameter: {name}")
+    return with_seeds(points, spec.get("replicates", 1), spec.get("sweep_seed", 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a parameter sweep and collect fractal metrics.')
+    parser.add_argument('spec', help='JSON sweep spec (see points_from_spec)')
+    parser.add_argument('--out', default='sweep_results.csv', help='Results table, rerun to resume')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: all cores)')
+    parser.add_argument('--ensemble', action='store_true',
+                        help='Step the replicates of each point together in one process (vector engine, stencil diffusion)')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='Reuse runs and measurements cached in DIR (see cache.py); ensembles only cache measurements')
+    args = parser.parse_args(argv)
+
+    with open(args.spec, 'r') as f:
+        spec = json.load(f)
+    run_sweep(points_from_spec(spec), spec.get("base", {}), args.out, args.workers, args.ensemble, args.cache)
+
+
+if __name__ == "__main__":
+    main()
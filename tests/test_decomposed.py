@@ -0,0 +1,45 @@
+import multiprocessing as mp
+import pytest
+import decomposed
+from decomposed import DecomposedSimulation
+
+PARAMS = {"r_max": 0.0498, "K_m": 0.25, "m_min": 1, "delta_H": 10, "F_d": 0.5, "mu": 0.8, "p": 0.02,
+          "density": 0.08}
+
+
+def simulation():
+    return DecomposedSimulation(64, PARAMS, 1.0, 0.05, 1, seed=1, num_agents=50, max_iters=100, workers=2)
+
+
+# An error in one worker reaches the main process and stops the others, which
+# would otherwise wait at the barrier forever
+@pytest.mark.skipif(mp.get_start_method() != "fork", reason="patches the workers' code through fork")
+def test_worker_error_is_raised(monkeypatch):
+    step = decomposed._step
+
+    def failing_step(rank, *args):
+        if rank == 1:
+            raise ValueError("worker failed")
+        step(rank, *args)
+
+    monkeypatch.setattr(decomposed, "_step", failing_step)
+    sim = simulation()
+    try:
+        with pytest.raises(ValueError, match="worker failed"):
+            sim.advance(5)
+    finally:
+        sim.close()
+
+
+def test_killed_worker_is_raised():
+    sim = simulation()
+    try:
+        sim.advance(2)
+        sim.processes[0].kill()
+        sim.processes[0].join()
+        with pytest.raises(RuntimeError, match="Worker 0 exited"):
+            sim.advance(2)
+    finally:
+        sim.close()
+    for process in sim.processes:
+        assert not process.is_alive()
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from config import load_config, build_state, build_ensemble
+from population import FIELDS
+
+SEEDS = [1, 2, 3]
+
+
+# Every replica of an ensemble gives exactly the agents and grid of an
+# independent vector/stencil run with its seed, replicas stopping at different
+# iterations on reaching max_agents
+@pytest.mark.parametrize("active_region", [True, False])
+def test_replicas_match_independent_runs(active_region):
+    config = load_config(overrides={"grid_size": 96, "max_iters": 600, "max_agents": 340,
+                                    "active_region": active_region})
+    results = build_ensemble(config, SEEDS).run()
+    for seed, result in zip(SEEDS, results):
+        state = build_state(dict(config, seed=seed))
+        state.paused = False
+        while state.iteration < config["max_iters"] and state.agent_count() < config["max_agents"]:
+            state.update()
+        population = state.population
+        assert result["iteration"] == state.iteration
+        assert np.array_equal(result["nutrient_grid"], state.petri.nutrient_grid)
+        for name in FIELDS:
+            assert np.array_equal(result[name], getattr(population, name)[:population.n])
+
+
+def test_other_engines_are_rejected():
+    with pytest.raises(ValueError):
+        build_ensemble(load_config(overrides={"diffusion": "implicit"}), SEEDS)
+    with pytest.raises(ValueError):
+        build_ensemble(load_config(overrides={"engine": "jit"}), SEEDS)
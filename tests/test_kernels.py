@@ -0,0 +1,43 @@
+import multiprocessing as mp
+import numpy as np
+import pytest
+import kernels
+from config import load_config, build_state
+from population import FIELDS
+
+pytestmark = pytest.mark.skipif(kernels.njit is None, reason="numba is not installed")
+
+
+def run(engine, diffusion, active_region, steps=500):
+    state = build_state(load_config(overrides={"grid_size": 96, "seed": 4, "engine": engine, "diffusion": diffusion,
+                                               "active_region": active_region}))
+    state.paused = False
+    for _ in range(steps):
+        state.update()
+    return state
+
+
+# Largest difference between the jit and the vector/stencil run, per array
+def differences(active_region):
+    reference, compiled = run("vector", "stencil", active_region), run("jit", "jit", active_region)
+    result = {"agents": abs(compiled.agent_count() - reference.agent_count()),
+              "nutrient_grid": np.abs(compiled.petri.nutrient_grid - reference.petri.nutrient_grid).max()}
+    if result["agents"] == 0:
+        n = reference.population.n
+        for name in FIELDS:
+            result[name] = float(np.abs(getattr(compiled.population, name)[:n].astype(float)
+                                        - getattr(reference.population, name)[:n].astype(float)).max())
+    return result
+
+
+# The compiled engine and diffusion backend against the vector engine with
+# stencil diffusion they reimplement. Run in a spawned process: after numba's
+# parallel (TBB) threads have started, a process that forks (as the live and
+# decomposed tests do) can hang on exit.
+@pytest.mark.parametrize("active_region", [True, False])
+def test_jit_matches_vector(active_region):
+    with mp.get_context("spawn").Pool(1) as pool:
+        result = pool.apply(differences, (active_region,))
+    assert result["agents"] == 0
+    for name, difference in result.items():
+        assert difference <= 1e-12, name
@@ -0,0 +1,24 @@
+import pytest
+from config import load_config
+from live import LiveSimulation
+
+
+# A config the simulation process cannot build: its exception reaches the
+# viewer instead of leaving it waiting for a frame or a reply
+def test_failing_config_raises_in_viewer():
+    config = load_config(overrides={"engine": "vector", "spatial_index": 1, "dormancy": 0.01, "grid_size": 64})
+    with pytest.raises(ValueError, match="Dormancy"):
+        LiveSimulation(config, max_agents=1000)
+
+
+def test_dead_process_raises_instead_of_hanging():
+    sim = LiveSimulation(load_config(overrides={"grid_size": 64, "max_iters": 10}), max_agents=1000)
+    try:
+        sim.process.kill()
+        sim.process.join()
+        with pytest.raises(RuntimeError):
+            sim.refresh()
+        with pytest.raises(RuntimeError):
+            sim.set_frames(None)
+    finally:
+        sim.close()
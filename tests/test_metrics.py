@@ -0,0 +1,27 @@
+import csv
+from config import load_config, build_state
+from metrics import MetricsRecorder
+
+
+def recorded_iterations(filename):
+    with open(filename, 'r', newline='') as f:
+        return [int(row["iteration"]) for row in csv.DictReader(f)]
+
+
+def record(filename, iterations, resume_from=None):
+    state = build_state(load_config(overrides={"grid_size": 64, "seed": 1}))
+    recorder = MetricsRecorder(10, filename, resume_from=resume_from)
+    for iteration in iterations:
+        state.iteration = iteration
+        recorder.observe(state)
+
+
+# Resuming drops the rows written after the checkpoint, a fresh run replaces
+# the old file
+def test_resume_and_fresh_runs(tmp_path):
+    filename = str(tmp_path / "metrics.csv")
+    record(filename, [10, 20, 30, 40])
+    record(filename, [30, 40, 50], resume_from=20)
+    assert recorded_iterations(filename) == [10, 20, 30, 40, 50]
+    record(filename, [10])
+    assert recorded_iterations(filename) == [10]
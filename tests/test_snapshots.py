@@ -0,0 +1,18 @@
+import pytest
+from config import load_config, build_state
+from snapshots import FrameWriter
+
+
+class FailingWriter(FrameWriter):
+    def write(self, frame):
+        raise OSError("disk full")
+
+
+# A failed write must not leave submit waiting on a dead thread
+def test_write_error_is_raised_instead_of_blocking():
+    state = build_state(load_config(overrides={"grid_size": 32, "seed": 1}))
+    writer = FailingWriter(maxsize=1)
+    with pytest.raises(OSError, match="disk full"):
+        for _ in range(10):
+            writer.submit(state)
+    writer.close()
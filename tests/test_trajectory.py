@@ -0,0 +1,18 @@
+import pytest
+from config import load_config, build_state
+from trajectory import TrajectoryRecorder
+
+
+class FailingRecorder(TrajectoryRecorder):
+    def write(self, iteration, c_max, grid, columns):
+        raise OSError("disk full")
+
+
+# A failed write must not leave observe waiting on a dead thread
+def test_write_error_is_raised_instead_of_blocking(tmp_path):
+    state = build_state(load_config(overrides={"grid_size": 32, "seed": 1}))
+    recorder = FailingRecorder(str(tmp_path / "trajectory"), interval=1, maxsize=1)
+    with pytest.raises(OSError, match="disk full"):
+        for _ in range(10):
+            recorder.observe(state)
+    recorder.close()
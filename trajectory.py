@@ -0,0 +1,186 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+# Agent columns kept for every recorded frame
+TRAJECTORY_FIELDS = {"x": np.float64, "y": np.float64, "mass": np.float64, "imotile": np.bool_}
+GRID_DTYPES = ("float32", "uint8")
+
+
+# Block mean of a grid over `factor` x `factor` cells (edges padded with the
+# last row/column so every block is full)
+def downsample_grid(grid, factor):
+    if factor == 1:
+        return grid
+    rows, cols = grid.shape
+    pad_rows, pad_cols = -rows % factor, -cols % factor
+    if pad_rows or pad_cols:
+        grid = np.pad(grid, ((0, pad_rows), (0, pad_cols)), mode='edge')
+    return grid.reshape(grid.shape[0] // factor, factor, grid.shape[1] // factor, factor).mean(axis=(1, 3))
+
+
+# Records the nutrient grid and the agents every `interval` iterations into a
+# folder of append-only binary files (add it to SimulationState.observers):
+#   grids.dat          one (downsampled) nutrient grid per frame, float32 or
+#                      uint8 quantised against C_max
+#   agents_<field>.dat the agent columns of every frame, one after the other
+#   index.dat          int64 (iteration, first agent, agent count) per frame
+#   meta.json          shapes and dtypes
+# observe only copies the state; downsampling and the bulk writes happen on a
+# background thread. A frame's index row is written after its data, so the
+# store is always readable up to the last complete frame. With
+# `resume_from`, frames after that iteration (e.g. written after the last
+# checkpoint of a crashed run) are dropped and recording continues. If a
+# write fails, later frames are discarded and the error is raised by the next
+# observe or close (as in snapshots.FrameWriter).
+class TrajectoryRecorder:
+    def __init__(self, path, interval, downsample=1, grid_dtype="float32", resume_from=None, maxsize=8):
+        if grid_dtype not in GRID_DTYPES:
+            raise ValueError(f"Unknown grid dtype: {grid_dtype}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.interval = interval
+        self.downsample = downsample
+        self.grid_dtype = grid_dtype
+        self.meta = None
+        self.agent_total = 0
+        self.failed = False
+        self.error = None
+        if os.path.exists(f"{path}/meta.json"):
+            with open(f"{path}/meta.json", 'r') as f:
+                self.meta = json.load(f)
+            self.downsample = self.meta["downsample"]
+            self.grid_dtype = self.meta["grid_dtype"]
+            self._truncate(resume_from)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def observe(self, state):
+        if state.iteration % self.interval:
+            return
+        self._raise_error()
+        columns = {name: np.array(values, dtype=dtype)
+                   for (name, dtype), values in zip(TRAJECTORY_FIELDS.items(), state.agent_arrays())}
+        self.queue.put((state.iteration, state.petri.C_max, state.petri.nutrient_grid.copy(), columns))
+
+    # Write whatever is still queued and stop the thread
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_error()
+
+    # Raise the write error, once
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.failed:
+                continue
+            try:
+                self.write(*item)
+            except Exception as error:
+                self.failed = True
+                self.error = error
+
+    def write(self, iteration, c_max, grid, columns):
+        grid = downsample_grid(grid, self.downsample)
+        if self.grid_dtype == "uint8":
+            grid = np.clip(np.rint(grid / c_max * 255), 0, 255)
+        grid = grid.astype(self.grid_dtype)
+        if self.meta is None:
+            self.meta = {"grid_shape": list(grid.shape), "grid_dtype": self.grid_dtype, "c_max": c_max,
+                         "downsample": self.downsample,
+                         "fields": {name: np.dtype(dtype).str for name, dtype in TRAJECTORY_FIELDS.items()}}
+            with open(f"{self.path}/meta.json", 'w') as f:
+                json.dump(self.meta, f, indent=4)
+
+        with open(f"{self.path}/grids.dat", 'ab') as f:
+            f.write(grid.tobytes())
+        count = len(columns["x"])
+        for name, values in columns.items():
+            with open(f"{self.path}/agents_{name}.dat", 'ab') as f:
+                f.write(values.tobytes())
+        with open(f"{self.path}/index.dat", 'ab') as f:
+            f.write(np.array([iteration, self.agent_total, count], dtype=np.int64).tobytes())
+        self.agent_total += count
+
+    # Cut every file back to the frames up to `iteration` (all frames if None)
+    def _truncate(self, iteration):
+        index = _read_index(self.path)
+        keep = len(index) if iteration is None else int(np.searchsorted(index[:, 0], iteration, side='right'))
+        self.agent_total = int(index[keep - 1, 1] + index[keep - 1, 2]) if keep else 0
+        grid_bytes = int(np.prod(self.meta["grid_shape"])) * np.dtype(self.meta["grid_dtype"]).itemsize
+        _truncate_file(f"{self.path}/index.dat", keep * 3 * 8)
+        _truncate_file(f"{self.path}/grids.dat", keep * grid_bytes)
+        for name, dtype in self.meta["fields"].items():
+            _truncate_file(f"{self.path}/agents_{name}.dat", self.agent_total * np.dtype(dtype).itemsize)
+
+
+def _truncate_file(filename, size):
+    if os.path.exists(filename):
+        with open(filename, 'r+b') as f:
+            f.truncate(size)
+
+
+def _read_index(path):
+    if not os.path.exists(f"{path}/index.dat") or os.path.getsize(f"{path}/index.dat") < 24:
+        return np.zeros((0, 3), dtype=np.int64)
+    index = np.fromfile(f"{path}/index.dat", dtype=np.int64)
+    return index[:len(index) // 3 * 3].reshape(-1, 3)
+
+
+# Read-only view of a recorded trajectory. Grids and agent columns are
+# memory-mapped, so opening even a very long history reads only the index
+# and each frame is loaded from disk when it is accessed.
+class Trajectory:
+    def __init__(self, path):
+        with open(f"{path}/meta.json", 'r') as f:
+            self.meta = json.load(f)
+        index = _read_index(path)
+        self.iterations = index[:, 0]
+        self.offsets = index[:, 1]
+        self.counts = index[:, 2]
+        self.c_max = self.meta["c_max"]
+        shape = (len(index), *self.meta["grid_shape"])
+        self.grids = np.memmap(f"{path}/grids.dat", dtype=self.meta["grid_dtype"], mode='r', shape=shape) \
+            if len(index) else np.zeros(shape, dtype=self.meta["grid_dtype"])
+        total = int(self.offsets[-1] + self.counts[-1]) if len(index) else 0
+        self.agents = {name: np.memmap(f"{path}/agents_{name}.dat", dtype=dtype, mode='r', shape=(total,))
+                       if total else np.zeros(0, dtype=dtype)
+                       for name, dtype in self.meta["fields"].items()}
+
+    def __len__(self):
+        return len(self.iterations)
+
+    # Position of a recorded iteration in the store
+    def frame_of(self, iteration):
+        i = int(np.searchsorted(self.iterations, iteration))
+        if i == len(self) or self.iterations[i] != iteration:
+            raise KeyError(f"Iteration {iteration} was not recorded")
+        return i
+
+    # Nutrient grid of frame i (in nutrient units, also for uint8 stores)
+    def grid(self, i):
+        grid = self.grids[i]
+        if self.meta["grid_dtype"] == "uint8":
+            return grid.astype(float) * (self.c_max / 255)
+        return grid
+
+    # Agent columns of frame i, as views into the memory maps
+    def agent_columns(self, i):
+        start, count = self.offsets[i], self.counts[i]
+        return {name: values[start:start + count] for name, values in self.agents.items()}
+
+    # (grid, agent columns) at a recorded iteration
+    def at(self, iteration):
+        i = self.frame_of(iteration)
+        return self.grid(i), self.agent_columns(i)